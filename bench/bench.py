@@ -0,0 +1,165 @@
+#/usr/bin/python3
+
+
+import os, sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import logging
+import statistics
+import subprocess
+
+from pathlib import Path
+
+from farm import make_origins, make_dirty
+from mock_gitlab import MockGitlab, make_project
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+GLONE = Path(__file__).resolve().parent.parent / 'glone.py'
+
+# (name, glone arguments, runs before timing to reach the measured state)
+BENCHMARKS = [
+	('update-clone',    ['update', '--local'],             None),
+	('update-fetch',    ['update', '--local'],             None),
+	('list-remote',     ['--refresh', 'list'],             None),
+	('list-cached',     ['list'],                          ['list']),
+	('list-local',      ['list', '--local'],               None),
+	('diff-path',       ['diff', '--path'],                None),
+	('diff-git',        ['diff', '--git', '--force'],      None),
+	('diff-git-warm',   ['diff', '--git'],                 ['diff', '--git']),
+	('diff-git-jsonl',  ['diff', '--git', '--format', 'jsonl'], None),
+]
+
+
+def parseArgs():
+	parser = argparse.ArgumentParser(description = "Benchmark glone subcommands on synthetic repo farms and a mock GitLab API")
+
+	parser.add_argument('--sizes',     type=int,    nargs='+', default=[10, 100],  help='Number of repos per farm')
+	parser.add_argument('--groups',    type=int,    default=4,     help='Number of groups the repos are spread over')
+	parser.add_argument('--branches',  type=int,    default=8,     help='Max number of branches per repo')
+	parser.add_argument('--dirty',     type=float,  default=0.2,   help='Ratio of repos with a dirty working tree')
+	parser.add_argument('--latency',   type=float,  default=0.05,  help='Delay per API request in seconds')
+	parser.add_argument('--per-page',  type=int,    default=100,   help='Max items per API page')
+	parser.add_argument('--repeat',    type=int,    default=3,     help='Timed runs per benchmark')
+	parser.add_argument('--jobs',      type=int,    default=4,     help='--jobs passed to glone')
+	parser.add_argument('--only',      type=str,    nargs='+',     help='Only run the named benchmarks')
+	parser.add_argument('--output',    type=str,    default='bench_results.json', help='File the results are written to')
+	parser.add_argument('--keep',      action='store_true',        help='Keep the generated farms')
+
+	return parser.parse_args()
+
+
+def write_config(root, mock, groups):
+	gitlab_config = root / 'python-gitlab.cfg'
+	gitlab_config.write_text(f"[global]\ndefault = mock\n\n[mock]\nurl = {mock.url}\nprivate_token = bench\napi_version = 4\n")
+
+	config = {
+		'cache': {'path': str(root / 'cache')},
+		'auth': [{'id': 'mock', 'server': 'mock', 'config': str(gitlab_config)}],
+		'remotes': [{
+			'id': 'mock',
+			'type': 'gitlab',
+			'auth': 'mock',
+			'users': [],
+			'groups': [{'id': namespace, 'source': namespace} for namespace in groups],
+		}],
+	}
+
+	path = root / 'glone.yml'
+	path.write_text(json.dumps(config))
+
+	return path
+
+
+def run_glone(config, prefix, jobs, arguments):
+	command = [sys.executable, str(GLONE), '-f', str(config), '--prefix', str(prefix), '--jobs', str(jobs), *arguments]
+
+	start = time.perf_counter()
+	result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+	elapsed = time.perf_counter() - start
+
+	if result.returncode != 0:
+		logging.warning(f"glone {' '.join(arguments)} failed: {result.stderr.strip().splitlines()[-1:]}")
+
+	return elapsed
+
+
+def run_size(size, args):
+	root = Path(tempfile.mkdtemp(prefix=f"glone-bench-{size}-"))
+	results = []
+
+	try:
+		logging.info(f"Creating farm with {size} repos in {root}")
+		layout = make_origins(root, size, groups=args.groups, branches=args.branches, jobs=args.jobs)
+
+		groups = {
+			namespace: [make_project(int(name[1:]), namespace, name, str(path)) for name, path in projects]
+			for namespace, projects in layout.items()
+		}
+		mock = MockGitlab(groups, latency=args.latency, max_per_page=args.per_page).start()
+		config = write_config(root, mock, groups)
+		prefix = root / 'repos'
+
+		for name, arguments, setup in BENCHMARKS:
+			if args.only and name not in args.only:
+				continue
+
+			times = []
+			for i in range(args.repeat if name != 'update-clone' else 1):
+				if setup:
+					run_glone(config, prefix, args.jobs, setup)
+
+				requests = mock.requests
+				times.append(run_glone(config, prefix, args.jobs, arguments))
+
+			results.append({
+				'size': size,
+				'benchmark': name,
+				'arguments': arguments,
+				'times': times,
+				'min': min(times),
+				'median': statistics.median(times),
+				'api_requests': mock.requests - requests,
+			})
+			logging.info(f"{size:>6} {name:<16} min {min(times):8.3f}s  median {statistics.median(times):8.3f}s")
+
+			if name == 'update-fetch':
+				make_dirty(prefix, ratio=args.dirty)
+
+		mock.stop()
+
+	finally:
+		if not args.keep:
+			shutil.rmtree(root, ignore_errors=True)
+
+	return results
+
+
+if __name__ == '__main__':
+	args = parseArgs()
+
+	results = []
+	for size in args.sizes:
+		results += run_size(size, args)
+
+	report = {
+		'meta': {
+			'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'git': subprocess.run(['git', '--version'], capture_output=True, text=True).stdout.strip(),
+			'options': vars(args),
+		},
+		'results': results,
+	}
+
+	with open(args.output, 'w') as file:
+		json.dump(report, file, indent=2)
+
+	logging.info(f"Results written to {args.output}")
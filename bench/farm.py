@@ -0,0 +1,108 @@
+#/usr/bin/python3
+
+
+import os, sys
+import logging
+import subprocess
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+GIT_ENV = {
+	'GIT_AUTHOR_NAME': 'glone-bench',
+	'GIT_AUTHOR_EMAIL': 'bench@glone.invalid',
+	'GIT_COMMITTER_NAME': 'glone-bench',
+	'GIT_COMMITTER_EMAIL': 'bench@glone.invalid',
+}
+
+
+def git(*args, cwd=None):
+	env = {**os.environ, **GIT_ENV}
+	result = subprocess.run(['git', *args], cwd=cwd, env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+	return result.stdout
+
+
+def make_seed(path, commits=5, branches=8):
+	"""Bare repo with a few commits on the default branch and branches b0..b<branches-1>"""
+	work = Path(f"{path}.work")
+	git('init', '-q', '-b', 'main', str(work))
+
+	for i in range(commits):
+		(work / 'file.txt').write_text(f"commit {i}\n")
+		git('add', 'file.txt', cwd=work)
+		git('commit', '-q', '-m', f"commit {i}", cwd=work)
+
+	for b in range(branches):
+		git('checkout', '-q', '-b', f"b{b}", 'main', cwd=work)
+		(work / f"branch-{b}.txt").write_text(f"branch {b}\n")
+		git('add', '.', cwd=work)
+		git('commit', '-q', '-m', f"branch {b}", cwd=work)
+
+	# The bare clone's HEAD follows the work repo, it must point to main which no origin deletes
+	git('checkout', '-q', 'main', cwd=work)
+	git('clone', '-q', '--bare', str(work), str(path))
+	subprocess.run(['rm', '-rf', str(work)], check=True)
+
+	return Path(path)
+
+
+def make_origins(root, size, groups=2, branches=8, jobs=8):
+	"""Create size bare origin repos below root/origin, spread over groups.
+
+	Every origin is a local clone of one seed repo (objects are hard
+	linked) keeping i % (branches + 1) of the seed's branches, so branch
+	counts vary across the farm. Returns {namespace: [(name, path)]}.
+	"""
+	root = Path(root)
+	seed = make_seed(root / 'seed.git', branches=branches)
+
+	layout = {f"grp{g}": [] for g in range(groups)}
+	for i in range(size):
+		namespace = f"grp{i % groups}"
+		layout[namespace].append((f"p{i}", root / 'origin' / namespace / f"p{i}.git"))
+
+	def _make(args):
+		i, path = args
+		git('clone', '-q', '--bare', '--local', str(seed), str(path))
+		for b in range(i % (branches + 1), branches):
+			git('update-ref', '-d', f"refs/heads/b{b}", cwd=path)
+
+	items = [(int(name[1:]), path) for projects in layout.values() for name, path in projects]
+	with ThreadPoolExecutor(max_workers=jobs) as executor:
+		list(executor.map(_make, items))
+
+	return layout
+
+
+def make_dirty(prefix, ratio=0.2, tracking=3):
+	"""Touch the local clones below prefix.
+
+	A ratio of the repos gets an untracked and a modified file, and every
+	repo gets up to tracking local branches following remote branches, with
+	one local commit on the first so divergence is reported. The clones are
+	left on their default branch.
+	"""
+	repos = sorted(p.parent for p in Path(prefix).rglob('.git'))
+	step = max(1, int(1 / ratio)) if ratio > 0 else 0
+
+	for i, repo in enumerate(repos):
+		# Remote branches are in packed-refs after a clone, ask git instead of globbing refs/
+		remote_refs = git('for-each-ref', '--format=%(refname:short)', 'refs/remotes/origin/b*', cwd=repo).split()
+		for n, remote_ref in enumerate(sorted(remote_refs)[:tracking]):
+			branch = f"local-{remote_ref[len('origin/'):]}"
+			if n == 0:
+				git('checkout', '-q', '-b', branch, '--track', remote_ref, cwd=repo)
+				git('commit', '-q', '--allow-empty', '-m', 'local', cwd=repo)
+				git('checkout', '-q', '-', cwd=repo)
+			else:
+				git('branch', '-q', '--track', branch, remote_ref, cwd=repo)
+
+		if step and i % step == 0:
+			(repo / 'untracked.txt').write_text("untracked\n")
+			(repo / 'file.txt').write_text("modified\n")
+
+	return repos
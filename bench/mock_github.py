@@ -0,0 +1,179 @@
+#/usr/bin/python3
+
+
+import os, sys
+import re
+import json
+import time
+import argparse
+import logging
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+OWNER_PATTERN = re.compile(r'(\w+): repositoryOwner\(login: \$(\w+)\) \{ repositories\(first: (\d+), after: \$(\w+)((?:, (?:isArchived|visibility): \w+)*)')
+
+
+class MockGithub(object):
+	"""Local stand-in for the parts of the GitHub GraphQL API used by GithubRemote.
+
+	Understands the queries GithubClient sends rather than GraphQL in
+	general: aliased repositoryOwner lookups with paged repositories and
+	the organizations of the viewer, the isArchived and visibility
+	arguments filter repositories. Cursors are item offsets. Every request
+	is delayed by latency seconds.
+	"""
+	def __init__(self, owners, organizations=None, latency=0.0, host='127.0.0.1', port=0):
+		self.owners = owners
+		self.organizations = organizations or []
+		self.latency = latency
+		self.requests = 0
+		self._lock = threading.Lock()
+
+		self._server = ThreadingHTTPServer((host, port), self._handler())
+		self._server.daemon_threads = True
+		self._thread = None
+
+
+	@property
+	def url(self):
+		host, port = self._server.server_address[:2]
+		return f"http://{host}:{port}/graphql"
+
+
+	def start(self):
+		self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+
+	def stop(self):
+		self._server.shutdown()
+		self._server.server_close()
+
+
+	def _handler(self):
+		mock = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def log_message(self, *args):
+				pass
+
+			def do_POST(self):
+				with mock._lock:
+					mock.requests += 1
+
+				if mock.latency:
+					time.sleep(mock.latency)
+
+				if not self.headers.get('Authorization', '').lower().startswith('bearer '):
+					self._send(401, {'message': 'Requires authentication'})
+					return
+
+				request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+				self._send(200, mock._execute(request['query'], request.get('variables') or {}))
+
+			def _send(self, code, body):
+				data = json.dumps(body).encode()
+
+				self.send_response(code)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(data)))
+				self.end_headers()
+				self.wfile.write(data)
+
+		return Handler
+
+
+	@staticmethod
+	def _page(items, first, cursor):
+		offset = int(cursor or 0)
+		end = offset + first
+
+		return {
+			'totalCount': len(items),
+			'pageInfo': {'hasNextPage': end < len(items), 'endCursor': str(end)},
+			'nodes': items[offset:end],
+		}
+
+
+	def _execute(self, query, variables):
+		if 'viewer' in query:
+			return {'data': {'viewer': {'organizations': self._page(self.organizations, 100, variables.get('cursor'))}}}
+
+		data = {}
+		errors = []
+		for alias, login, first, cursor, arguments in OWNER_PATTERN.findall(query):
+			login = variables[login]
+
+			if login not in self.owners:
+				data[alias] = None
+				errors.append({'type': 'NOT_FOUND', 'path': [alias], 'message': f"Could not resolve to a User with the login of '{login}'."})
+				continue
+
+			repositories = self.owners[login]
+			for key, value in re.findall(r'(isArchived|visibility): (\w+)', arguments):
+				if key == 'isArchived':
+					repositories = [r for r in repositories if r['isArchived'] == (value == 'true')]
+				else:
+					repositories = [r for r in repositories if r['visibility'] == value]
+
+			data[alias] = {'repositories': self._page(repositories, int(first), variables.get(cursor))}
+
+		result = {'data': data}
+		if errors:
+			result['errors'] = errors
+
+		return result
+
+
+def make_repository(repo_id, owner, name, url, pushed_at='2024-01-01T00:00:00Z'):
+	"""Repository node as returned by the GraphQL API, both clone urls point to url"""
+	return {
+		'databaseId': repo_id,
+		'name': name,
+		'nameWithOwner': f"{owner}/{name}",
+		'sshUrl': url,
+		'url': url[:-len('.git')] if url.endswith('.git') else url,
+		'pushedAt': pushed_at,
+		'isArchived': False,
+		'visibility': 'PRIVATE',
+		'parent': None,
+	}
+
+
+def parseArgs():
+	parser = argparse.ArgumentParser(description = "Run a mock GitHub GraphQL API serving synthetic organizations")
+
+	parser.add_argument('--orgs',      type=int,    default=2,    help='Number of organizations')
+	parser.add_argument('--repos',     type=int,    default=100,  help='Number of repositories per organization')
+	parser.add_argument('--latency',   type=float,  default=0.0,  help='Delay per request in seconds')
+	parser.add_argument('--port',      type=int,    default=8081, help='Port to listen on')
+
+	return parser.parse_args()
+
+
+if __name__ == '__main__':
+	args = parseArgs()
+
+	owners = {}
+	for o in range(args.orgs):
+		login = f"org{o}"
+		owners[login] = [
+			make_repository(o * args.repos + r, login, f"r{r}", f"git@localhost:{login}/r{r}.git")
+			for r in range(args.repos)
+		]
+
+	organizations = [{'login': login, 'name': login} for login in sorted(owners)]
+
+	mock = MockGithub(owners, organizations, latency=args.latency, port=args.port).start()
+	logging.info(f"Serving mock GitHub GraphQL API on {mock.url}")
+
+	try:
+		mock._thread.join()
+	except KeyboardInterrupt:
+		mock.stop()
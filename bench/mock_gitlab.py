@@ -0,0 +1,243 @@
+#/usr/bin/python3
+
+
+import os, sys
+import re
+import json
+import time
+import argparse
+import logging
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote, urlencode
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+
+# Attributes missing from the 'simple=true' projection
+SIMPLE_OMITTED = {'archived', 'visibility', 'forked_from_project', 'updated_at'}
+
+
+class MockGitlab(object):
+	"""Local stand-in for the parts of the GitLab v4 API used by GitlabRemote.
+
+	Serves /groups, /groups/:id/projects and /users/:id/projects with
+	GitLab's pagination headers. Groups named 'a/b' are subgroups of 'a'. Every request is delayed by latency
+	seconds and at most max_per_page items are returned per page. With
+	rate_limit set, requests beyond rate_limit per second are answered
+	with 429 and a Retry-After header, like GitLab's rate limiter.
+	"""
+	def __init__(self, groups, users=None, latency=0.0, max_per_page=100, rate_limit=None, host='127.0.0.1', port=0):
+		self.groups = groups
+		self.users = users or {}
+		self.latency = latency
+		self.max_per_page = max_per_page
+		self.rate_limit = rate_limit
+		self.requests = 0
+		self.throttled = 0
+		self._window = (0, 0)
+		self._lock = threading.Lock()
+
+		self._server = ThreadingHTTPServer((host, port), self._handler())
+		self._server.daemon_threads = True
+		self._thread = None
+
+
+	@property
+	def url(self):
+		host, port = self._server.server_address[:2]
+		return f"http://{host}:{port}"
+
+
+	def start(self):
+		self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+
+	def stop(self):
+		self._server.shutdown()
+		self._server.server_close()
+
+
+	def _handler(self):
+		mock = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def log_message(self, *args):
+				pass
+
+			def do_GET(self):
+				with mock._lock:
+					mock.requests += 1
+
+				if mock._throttle():
+					self._send(429, {'message': '429 Too Many Requests'}, {'Retry-After': '1'})
+					return
+
+				if mock.latency:
+					time.sleep(mock.latency)
+
+				url = urlparse(self.path)
+				query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+				items = mock._route(unquote(url.path), query)
+				if items is None:
+					self._send(404, {'message': '404 Not Found'})
+					return
+
+				self._send_page(url.path, query, items)
+
+			def _send_page(self, path, query, items):
+				per_page = min(int(query.get('per_page', 20)), mock.max_per_page)
+				page = int(query.get('page', 1))
+				total_pages = max(1, (len(items) + per_page - 1) // per_page)
+
+				headers = {
+					'X-Total': str(len(items)),
+					'X-Total-Pages': str(total_pages),
+					'X-Page': str(page),
+					'X-Per-Page': str(per_page),
+				}
+
+				if page < total_pages:
+					headers['X-Next-Page'] = str(page + 1)
+					next_query = urlencode({**query, 'page': page + 1, 'per_page': per_page})
+					headers['Link'] = f'<{mock.url}{path}?{next_query}>; rel="next"'
+
+				self._send(200, items[(page - 1) * per_page:page * per_page], headers)
+
+			def _send(self, code, body, headers={}):
+				data = json.dumps(body).encode()
+
+				self.send_response(code)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(data)))
+				for key, value in headers.items():
+					self.send_header(key, value)
+				self.end_headers()
+				self.wfile.write(data)
+
+		return Handler
+
+
+	def _throttle(self):
+		"""True if the request exceeds rate_limit requests in the current second"""
+		if not self.rate_limit:
+			return False
+
+		with self._lock:
+			second, count = self._window
+			now = int(time.time())
+			count = count + 1 if second == now else 1
+			self._window = (now, count)
+
+			if count > self.rate_limit:
+				self.throttled += 1
+				return True
+
+		return False
+
+
+	def _filter(self, projects, query):
+		if 'updated_after' in query:
+			projects = [p for p in projects if p['updated_at'] > query['updated_after']]
+
+		if 'last_activity_after' in query:
+			projects = [p for p in projects if p['last_activity_at'] > query['last_activity_after']]
+
+		if 'archived' in query:
+			projects = [p for p in projects if p['archived'] == (query['archived'].lower() == 'true')]
+
+		if 'visibility' in query:
+			projects = [p for p in projects if p['visibility'] == query['visibility']]
+
+		if 'search' in query:
+			projects = [p for p in projects if query['search'].lower() in f"{p['name']} {p['path']}".lower()]
+
+		if query.get('simple', '').lower() == 'true':
+			projects = [{key: value for key, value in p.items() if key not in SIMPLE_OMITTED} for p in projects]
+
+		return projects
+
+
+	def _route(self, path, query):
+		match = re.match(r'^/api/v4/groups/?$', path)
+		if match:
+			ids = {name: i for i, name in enumerate(sorted(self.groups), start=1)}
+			groups = [
+				{'id': ids[name], 'path': name.rpartition('/')[2], 'name': name.rpartition('/')[2], 'full_path': name,
+					'parent_id': ids.get(name.rpartition('/')[0])}
+				for name in sorted(self.groups)
+			]
+
+			if query.get('top_level_only', '').lower() == 'true':
+				groups = [g for g in groups if g['parent_id'] is None]
+
+			return groups
+
+		match = re.match(r'^/api/v4/groups/(.+)/projects/?$', path)
+		if match:
+			if match.group(1) not in self.groups:
+				return None
+			return self._filter(self.groups[match.group(1)], query)
+
+		match = re.match(r'^/api/v4/users/(.+)/projects/?$', path)
+		if match:
+			if match.group(1) not in self.users:
+				return None
+			return self._filter(self.users[match.group(1)], query)
+
+		return None
+
+
+def make_project(project_id, namespace, name, url, updated_at='2024-01-01T00:00:00Z'):
+	"""Project as returned by the GitLab API, both clone urls point to url"""
+	return {
+		'id': project_id,
+		'name': name,
+		'path': name,
+		'path_with_namespace': f"{namespace}/{name}",
+		'ssh_url_to_repo': url,
+		'http_url_to_repo': url,
+		'last_activity_at': updated_at,
+		'updated_at': updated_at,
+		'archived': False,
+		'visibility': 'private',
+	}
+
+
+def parseArgs():
+	parser = argparse.ArgumentParser(description = "Run a mock GitLab API serving synthetic groups")
+
+	parser.add_argument('--groups',    type=int,    default=2,    help='Number of groups')
+	parser.add_argument('--projects',  type=int,    default=100,  help='Number of projects per group')
+	parser.add_argument('--latency',   type=float,  default=0.0,  help='Delay per request in seconds')
+	parser.add_argument('--per-page',  type=int,    default=100,  help='Max items per page')
+	parser.add_argument('--rate-limit', type=int,   default=None, help='Max requests per second, more are answered with 429')
+	parser.add_argument('--port',      type=int,    default=8080, help='Port to listen on')
+
+	return parser.parse_args()
+
+
+if __name__ == '__main__':
+	args = parseArgs()
+
+	groups = {}
+	for g in range(args.groups):
+		namespace = f"grp{g}"
+		groups[namespace] = [
+			make_project(g * args.projects + p, namespace, f"p{p}", f"git@localhost:{namespace}/p{p}.git")
+			for p in range(args.projects)
+		]
+
+	mock = MockGitlab(groups, latency=args.latency, max_per_page=args.per_page, rate_limit=args.rate_limit, port=args.port).start()
+	logging.info(f"Serving mock GitLab API on {mock.url}")
+
+	try:
+		mock._thread.join()
+	except KeyboardInterrupt:
+		mock.stop()
@@ -3,22 +3,33 @@
 
 import os, sys
 import argparse
-import yaml
+import pstats
+import cProfile
 import logging
 
 from pathlib import Path
 
-from git import Repo
-
-from cerberus import Validator
-
 from pprint import pprint
-from tabulate import tabulate
 
 from glone import schema
 from glone import GithubRemote, GitlabRemote
-from glone import GloneGroup
 from glone import GloneRepo
+from glone import normalize_url
+from glone import RepoInventory
+from glone.cache import RemoteCache, default_cache_dir
+from glone.config import load_config, ConfigError
+from glone.pool import run_parallel
+from glone.engine import Engine
+from glone.scanner import LocalScanner, STATE_DIR, get_repo_path, is_bare
+from glone.backend import BACKENDS, get_backend
+from glone.status import StatusCache, format_branch
+from glone.output import get_output
+from glone.timing import timings
+from glone.sync import update_repo, mirror_repo
+from glone.state import SyncState, SKIP_MODES
+from glone.journal import RunJournal
+from glone.tasks import TaskGraph, TaskCache, TaskError
+from glone.maintenance import get_pack_stats, maintenance_score, maintain_repo, get_rate_limit
 
 
 
@@ -26,6 +37,7 @@ logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INF
 
 DEFAULT_GLONE_FILE    = 'glone.yml'
 DEFAULT_GLONE_PREFIX  = './repos'
+DEFAULT_GLONE_JOBS    = 4
 
 
 # Arg parsing
@@ -38,14 +50,43 @@ def parseArgs():
 	parser.add_argument('--prefix',         help='Root directory for git repositories to be cloned into',
 		type=str, default=DEFAULT_GLONE_PREFIX,  required=False)
 
+	parser.add_argument('-j', '--jobs',     help='Number of repos to process in parallel',
+		type=int, default=DEFAULT_GLONE_JOBS,    required=False)
+
+	parser.add_argument('--api-jobs',       help='Max concurrent requests to the remotes (default: --jobs)',
+		type=int, default=None,                  required=False)
+
+	parser.add_argument('--network-jobs',   help='Max concurrent git commands talking to a remote (default: --jobs)',
+		type=int, default=None,                  required=False)
+
+	parser.add_argument('--local-jobs',     help='Max concurrent git commands on local repos (default: number of CPUs)',
+		type=int, default=None,                  required=False)
+
+	cache_group = parser.add_mutually_exclusive_group(required=False)
+	cache_group.add_argument('--offline',  action='store_true',  help='Only use cached remote inventories, never contact a remote')
+	cache_group.add_argument('--refresh',  action='store_true',  help='Ignore cached remote inventories and fetch them again')
+
+	parser.add_argument('--backend',        help='How local repos are read: \'native\' reads refs and config files, \'git\' runs a git process per query',
+		type=str, default='native',              required=False, choices=BACKENDS.keys())
+
+	parser.add_argument('--timings',        help='Print time spent per phase and the slowest repos at the end',
+		action='store_true')
+
+	parser.add_argument('--trace',          help='Write a Chrome trace (JSON timeline) of the run to this file',
+		type=str, default=None,                  required=False)
+
+	parser.add_argument('--profile',        help='Run the command (main thread) under cProfile and write the stats to this file',
+		type=str, default=None,                  required=False)
+
 	subparsers = parser.add_subparsers(dest='command', help='')
 
 	parser_diff = subparsers.add_parser('diff', help='Show diff between local and remote')
-	parser_diff.add_argument('--format',  type=str,  default='github', help='Output format (supports \'tabulate\' formats)')
+	parser_diff.add_argument('--format',  type=str,  default='github', help='Output format (supports \'tabulate\' formats and \'jsonl\' for streaming)')
 	parser_diff.add_argument('--git',     action='store_true',         help='Show diff of git repo (git status --porcelain)')
 	parser_diff.add_argument('--path',    action='store_true',         help='Show diff of repo location')
 	parser_diff.add_argument('--all',     action='store_true',         help='Show all diff options')
 	parser_diff.add_argument('--max',     type=int,  default=10,       help='Max lines for git status (-1 = unlimited)')
+	parser_diff.add_argument('--force',   action='store_true',         help='Collect the git status of all repos, even if unchanged since the last run')
 	parser_diff.set_defaults(func=diff_repos)
 
 	parser_update = subparsers.add_parser('update', help='Update local or remote state')
@@ -53,13 +94,31 @@ def parseArgs():
 	update_group.add_argument('--local',    action='store_true',  help='Update local state from remote')
 	update_group.add_argument('--remote',   action='store_true',  help='Update remote state from local')
 	update_group.add_argument('--dry-run',  action='store_true',  help='Only perform a dry run of the update, no actual changes')
+	parser_update.add_argument('--mirror',  action='store_true',  help='Keep bare mirrors (<dest>.git) instead of working trees (implies --skip-unchanged activity)')
+	parser_update.add_argument('--skip-unchanged', nargs='?', const='activity', default=None, choices=SKIP_MODES,
+		help='Skip existing repos whose remote did not change since the last sync, by last activity (default) or advertised refs')
+	parser_update.add_argument('--rerun-tasks', action='store_true',
+		help='Run cached tasks even if the HEADs they depend on did not change since they last succeeded')
+	journal_group = parser_update.add_mutually_exclusive_group(required=False)
+	journal_group.add_argument('--resume',        action='store_const', dest='journal', const='resume',
+		help='Continue the last run, skipping repos and tasks it finished')
+	journal_group.add_argument('--retry-failed',  action='store_const', dest='journal', const='retry-failed',
+		help='Only rerun the repos that failed in the last run, skipping the tasks they finished')
 	parser_update.set_defaults(func=update_repos)
 
+	parser_maintain = subparsers.add_parser('maintain', help='Repack and index local repos, worst pack stats first')
+	parser_maintain.add_argument('--dry-run',    action='store_true',         help='Only show the stats and the commands that would run')
+	parser_maintain.add_argument('--limit',      type=int,   default=None,    help='Only maintain the N repos with the worst pack stats')
+	parser_maintain.add_argument('--min-score',  type=int,   default=1,       help='Skip repos scoring below this (loose objects, extra packs, missing indexes)')
+	parser_maintain.add_argument('--rate',       type=float, default=0,       help='Start at most this many repos per second (0 = no limit)')
+	parser_maintain.add_argument('--threads',    type=int,   default=1,       help='Threads per git command, the CPUs used are at most --local-jobs times this')
+	parser_maintain.set_defaults(func=maintain_repos)
+
 	parser_list = subparsers.add_parser('list', help='List known repos')
 	list_group = parser_list.add_mutually_exclusive_group(required=False)
 	list_group.add_argument('--local',    action='store_true',          help='List local repos')
 	list_group.add_argument('--remote',   action='store_true',          help='List remote repos')
-	parser_list.add_argument('--format',  type=str,  default='github',  help='Output format (supports \'tabulate\' formats)')
+	parser_list.add_argument('--format',  type=str,  default='github',  help='Output format (supports \'tabulate\' formats and \'jsonl\' for streaming)')
 	parser_list.set_defaults(func=list_repos)
 
 	args = parser.parse_args()
@@ -82,17 +141,37 @@ def get_auth(config, auth_id):
 
 
 # Functions
-def get_remotes(config):
+def get_cache(config, args):
+	cache_config = config['cache']
+
+	return RemoteCache(
+		cache_config.get('path', default_cache_dir()),
+		cache_config['ttl'],
+		offline=args.offline,
+		refresh=args.refresh
+	)
+
+
+def get_engine(config, args):
+	return Engine(
+		api=args.api_jobs or args.jobs,
+		network=args.network_jobs or args.jobs,
+		local=args.local_jobs,
+		limits=config['limits']
+	)
+
+
+def get_remotes(config, cache=None, session=None):
 	remotes = []
 
-	for remote in config['remotes']:
+	for remote in config.get('remotes', []):
 		auth = get_auth(config, remote['auth'])
 
 		if remote['type'] == schema.RemoteType.GITLAB.value:
-			remotes.append(GitlabRemote(auth, remote, {'defaults': config.get('defaults', {})}))
+			remotes.append(GitlabRemote(auth, remote, {'defaults': config.get('defaults', {})}, cache, session))
 
 		elif remote['type'] == schema.RemoteType.GITHUB.value:
-			remotes.append(GithubRemote(auth, remote, {'defaults': config.get('defaults', {})}))
+			remotes.append(GithubRemote(auth, remote, {'defaults': config.get('defaults', {})}, cache, session))
 
 		else:
 			logging.error(f"Unknown remote type '{config['type']}'")
@@ -110,13 +189,42 @@ def get_repos(config):
 	return repos
 
 
-def get_local_repos(prefix):
-	start_path = Path(prefix)
-	git_dirs = [str(p) for p in start_path.rglob('.git') if p.is_dir()]
-	return git_dirs
+def iter_repos(config, cache=None, session=None):
+	"""Yield remote and configured repos.
+
+	Remotes are only set up (and contacted) once the first repo is
+	requested, commands working on the local tree only never iterate.
+	"""
+	with timings.phase('remote-setup'):
+		remotes = get_remotes(config, cache, session)
+
+	for remote in remotes:
+		yield from remote.get_repos()
+
+	yield from get_repos(config)
 
 
-def update_repos(repos, config, args):
+def get_local_repos(prefix, jobs=DEFAULT_GLONE_JOBS):
+	with timings.phase('scan'):
+		return LocalScanner(prefix, jobs).scan()
+
+
+def iter_local_remotes(git_dirs, jobs=DEFAULT_GLONE_JOBS, backend='native'):
+	"""Read the remotes of every local repo once, yields (git_dir, [(name, url)]) as they are read"""
+	def _remotes(git_dir):
+		return get_backend(backend).remotes(get_repo_path(git_dir))
+
+	for git_dir, remotes, error in run_parallel(_remotes, git_dirs, jobs):
+		if error:
+			logging.warning(f"Unable to read remotes of {get_repo_path(git_dir)}: {error}")
+		yield git_dir, remotes or []
+
+
+def get_local_remotes(git_dirs, jobs=DEFAULT_GLONE_JOBS, backend='native'):
+	return dict(iter_local_remotes(git_dirs, jobs, backend))
+
+
+def update_repos(engine, repos, config, args):
 	output_dir = Path(args.prefix)
 	output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -124,198 +232,335 @@ def update_repos(repos, config, args):
 		pass
 
 	else: # local (default)
-		if args.dry_run: # Only do dry run
-			for repo in repos:
-				repo_path = output_dir / repo.dest
+		failed = []
+		succeeded = []
 
-				logging.info(f"Update {repo.name} in {repo_path}")
+		skipped = []
+		unselected = []
+		state = SyncState(output_dir)
+		journal = RunJournal(output_dir)
+		graph = TaskGraph()
+		task_cache = TaskCache(output_dir, force=args.rerun_tasks)
+		skip_mode = args.skip_unchanged or ('activity' if args.mirror else None)
 
-				if not os.path.exists(repo_path):
-					logging.info(f"\tgit clone {repo.source} {repo_path}")
+		def _path(repo):
+			return output_dir / f"{repo.dest}.git" if args.mirror else output_dir / repo.dest
 
-				for task in repo.tasks:
-					if not task.startswith("git "):
-						task = f"git {task}"
-					logging.info(f"\t{task}")
-		else: # Do the changes
+		def _selected(repos):
 			for repo in repos:
-				repo_path = output_dir / repo.dest
-
-				logging.info(f"Update {repo.name} in {repo_path}")
-
-				if not os.path.exists(repo_path):
-					logging.info(f"\tgit clone {repo.source} {repo_path}")
-					Path(repo_path.parent).mkdir(parents=True, exist_ok=True)
-					Repo.clone_from(repo.source, repo_path)
-
-				git_repo = Repo(repo_path)
-				for task in repo.tasks:
-					if not task.startswith("git "):
-						task = f"git {task}"
-					logging.info(f"\t{task}")
-					git_repo.git.execute(task.split(" "))
+				if journal.select(str(repo.dest)) is None:
+					unselected.append(repo)
+				else:
+					yield repo
+
+		async def _update(repo):
+			key = str(repo.dest)
+			done = journal.select(key)
+
+			# Added before the first await, so the repo is known when the graph is closed
+			if not args.mirror:
+				graph.add(repo, _path(repo))
+
+			try:
+				unchanged, current = await state.check(engine, repo, skip_mode)
+				if unchanged and _path(repo).exists():
+					skipped.append(repo)
+					graph.settle(repo)
+					journal.finish(key, 'done')
+					return ["skip, remote unchanged since last sync"]
+
+				if args.mirror:
+					output = await mirror_repo(engine, repo, _path(repo), dry_run=args.dry_run)
+				else:
+					output = await update_repo(engine, repo, _path(repo), dry_run=args.dry_run, reference_dir=output_dir / STATE_DIR / 'objects',
+						done=done, on_step=lambda step: journal.step(key, step), graph=graph, task_cache=task_cache)
+			except Exception:
+				graph.settle(repo, "update failed")
+				raise
+
+			if not args.dry_run:
+				state.record(repo, current)
+
+			journal.finish(key, 'done')
+
+			return output
+
+		def _exhausted():
+			# Repos finished by the previous run still satisfy the dependencies on them
+			for repo in unselected:
+				try:
+					graph.add(repo, _path(repo))
+				except TaskError:
+					continue
+				graph.settle(repo, "failed in previous run" if journal.repos.get(str(repo.dest), {}).get('status') == 'failed' else None)
+
+			graph.close()
+
+		async def _run():
+			async for repo, output, error in engine.map(_update, _selected(repos), on_exhausted=_exhausted):
+				logging.info(f"Update {repo.name} in {_path(repo)}")
+				for line in output or getattr(error, 'output', []):
+					logging.info(f"\t{line}")
+
+				if error:
+					logging.error(f"\t{getattr(error, 'error', error)}")
+					journal.finish(str(repo.dest), 'failed')
+					failed.append(repo)
+				else:
+					succeeded.append(repo)
+
+		journal.open(args.journal, dry_run=args.dry_run)
+
+		# Progress is kept if the run is interrupted, --resume continues it
+		try:
+			engine.run(_run())
+		finally:
+			journal.close()
+			if not args.dry_run:
+				state.store()
+				task_cache.store()
+
+		logging.info(f"Updated {len(succeeded)} repos ({len(skipped)} unchanged), {len(failed)} failed")
+		if args.journal:
+			logging.info(f"\t{len(unselected)} repos not selected for --{args.journal}")
+		for repo in sorted(failed, key=lambda r: r.name):
+			logging.error(f"\tFailed: {repo.name} ({repo.source})")
+
+		if failed:
+			sys.exit(1)
 
 
-def diff_repos(repos, config, args):
-	git_dirs = get_local_repos(args.prefix)
+def diff_repos(engine, repos, config, args):
+	git_dirs = get_local_repos(args.prefix, args.jobs)
 	local_only = [git_dir for git_dir in git_dirs]
 
-	git_dirs = list(sorted(git_dirs, key=lambda d: Path(d).parent.name))
-	repos = list(sorted(repos, key=lambda r: r.name))
-
 	if args.path or args.all:
 		# Both but different paths
-		data = []
-		header = ["Name", "Remote", "Local Path", "Config Dest"]
-		data = [header]
+		columns = [('name', "Name"), ('remote', "Remote"), ('local_path', "Local Path"), ('dest', "Config Dest")]
+		output = get_output(args.format, columns, title="Repos with unexpected location", kind='path')
+
+		if not output.streaming:
+			repos = RepoInventory(repos).sorted()
+
+		local_remotes = get_local_remotes(local_only, args.jobs, args.backend)
 
+		# Index the local repos by their normalized remote urls
+		url_index = {}
+		for git_dir, remotes in local_remotes.items():
+			for name, url in remotes:
+				url_index.setdefault(normalize_url(url), []).append(git_dir)
+
+		matched = set()
 		for repo in repos:
-			found = False
-			for git_dir in local_only:
-				remotes = [remote.url for remote in Repo(git_dir).remotes]
-				if repo.source in remotes:
-					found = True
-					if (Path(args.prefix) / repo.dest != Path(git_dir).parent):
-						row = [
-							repo.name,
-							repo.source,
-							Path(git_dir).parent,
-							Path(args.prefix) / repo.dest
-						]
-						data.append(row)
+			found = url_index.get(normalize_url(repo.source), [])
+			matched.update(found)
+
+			for git_dir in found:
+				# Mirrors (bare repos) are kept at <dest>.git
+				dest = Path(args.prefix) / (f"{repo.dest}.git" if is_bare(git_dir) else repo.dest)
+				if (dest != get_repo_path(git_dir)):
+					output.write({
+						'name': repo.name,
+						'remote': repo.source,
+						'local_path': get_repo_path(git_dir),
+						'dest': dest
+					})
 
 			if not found:
-				row = [
-					repo.name,
-					repo.source,
-					"-",
-					Path(args.prefix) / repo.dest
-				]
-				data.append(row)
+				output.write({
+					'name': repo.name,
+					'remote': repo.source,
+					'local_path': "-",
+					'dest': Path(args.prefix) / repo.dest
+				})
 
 		for git_dir in local_only:
-			remotes = [remote.url for remote in Repo(git_dir).remotes]
-			found = False
-			for repo in repos:
-				if repo.source in remotes:
-					found = True
+			if git_dir not in matched:
+				remotes = local_remotes[git_dir]
+				output.write({
+					'name': get_repo_path(git_dir).name,
+					'remote': remotes[0][1] if len(remotes) > 0 else "-",
+					'local_path': get_repo_path(git_dir),
+					'dest': "-"
+				})
 
-			if not found:
-				row = [
-					Path(git_dir).parent.name,
-					remotes[0] if len(remotes) > 0 else "-",
-					Path(git_dir).parent,
-					"-"
-				]
-				data.append(row)
-
-		print("# Repos with unexpected location")
-		print("")
-		print(tabulate(data, headers="firstrow", tablefmt=args.format))
-		print("\n")
+		output.close()
 
 
 	if args.git or args.all:
 		# Git status
-		data = []
-		header = ["Name", "Path", "Status", "Branches"]
-		data = [header]
-
-		for git_dir in local_only:
-			repo = Repo(git_dir)
-			diffs = repo.git.status('--porcelain').split('\n')
-			if len(diffs) > args.max:
-				diffs = diffs[:args.max] + ["..."]
-			branches = repo.branches
-			active_branch = repo.active_branch
-
-			branch_list = []
-			for branch in branches:
-				pref = '*' if branch.name == active_branch.name else "-"
-				tracking_branch = branch.tracking_branch()
-				if tracking_branch:
-					branch_diff = repo.git.rev_list('--left-right', '--count', f'{tracking_branch.name}...{branch.name}').split()
-					branch_list.append(f"{pref} {branch.name} [{tracking_branch.name} v{branch_diff[0]} / ^{branch_diff[1]}]")
-				else:
-					branch_list.append(f"{pref} {branch.name} []")
+		def _rows(record):
+			diffs = record['status']
+			branch_list = [format_branch(b['head'], b['name'], b['upstream'], b['divergence']) for b in record['branches']]
 
+			rows = []
 			for i in range(max(len(diffs), len(branch_list), 1)):
-				row = [
-					Path(git_dir).parent.name if i == 0 else "",
-					Path(git_dir).parent if i == 0 else "",
+				rows.append([
+					record['name'] if i == 0 else "",
+					record['path'] if i == 0 else "",
 					diffs[i] if i < len(diffs) else "",
 					branch_list[i] if i < len(branch_list) else ""
-				]
-				data.append(row)
+				])
 
-		print("# Repos status")
-		print("")
-		print(tabulate(data, headers="firstrow", tablefmt=args.format))
-		print("\n")
+			return rows
 
+		columns = [('name', "Name"), ('path', "Path"), ('status', "Status"), ('branches', "Branches")]
+		output = get_output(args.format, columns, title="Repos status", kind='git', sort_key=lambda r: os.path.join(r['path'], '.git'), to_rows=_rows)
 
-def list_repos(repos, config, args):
-	data = []
+		status_cache = StatusCache(args.prefix, get_backend(args.backend), force=args.force)
 
-	if args.local:
-		git_dirs = get_local_repos(args.prefix)
+		# Bare repos have no working tree to report the status of
+		work_trees = [git_dir for git_dir in local_only if not is_bare(git_dir)]
 
-		git_dirs = list(sorted(git_dirs, key=lambda d: Path(d).parent.name))
+		async def _status(git_dir):
+			return await engine.call('local', status_cache.get_status, git_dir)
 
-		header = ["Name", "Path", "Remote"]
-		data = [header]
+		async def _run():
+			async for git_dir, status, error in engine.map(_status, work_trees):
+				if error:
+					logging.warning(f"Unable to get status of {get_repo_path(git_dir)}: {error}")
 
-		for git_dir in git_dirs:
-			row = [
-				Path(git_dir).parent.name,
-				Path(git_dir).parent,
-				[f"{remote.name}: {remote.url}" for remote in Repo(git_dir).remotes]
-			]
-			data.append(row)
+				diffs, branches = status or (["?"], [])
+				if args.max >= 0 and len(diffs) > args.max:
+					diffs = diffs[:args.max] + ["..."]
 
-	else: # remote (default)
-		header = ["Name", "Remote", "Dest"]
+				output.write({
+					'name': get_repo_path(git_dir).name,
+					'path': get_repo_path(git_dir),
+					'status': diffs,
+					'branches': [
+						{'head': head, 'name': name, 'upstream': upstream, 'divergence': divergence}
+						for head, name, upstream, divergence in branches
+					]
+				})
 
-		repos = list(sorted(repos, key=lambda r: r.name))
+		engine.run(_run())
 
-		data = [header]
-		for repo in repos:
-			row = [
-				repo.name,
-				repo.source,
-				Path(args.prefix) / repo.dest
-			]
-			data.append(row)
+		status_cache.store(work_trees)
 
-	print(tabulate(data, headers="firstrow", tablefmt=args.format))
-	print("")
+		output.close()
 
 
-# Main
-if '__name__' != '__main__':
-	args = parseArgs()
+def maintain_repos(engine, repos, config, args):
+	git_dirs = get_local_repos(args.prefix, args.jobs)
+	paths = [get_repo_path(git_dir) for git_dir in git_dirs]
+
+	stats = {}
+	failed = []
+
+	async def _stats():
+		async for path, result, error in engine.map(lambda p: get_pack_stats(engine, p), paths):
+			if error:
+				logging.warning(f"Unable to read pack stats of {path}: {error}")
+			else:
+				stats[path] = result
+
+	with timings.phase('pack-stats'):
+		engine.run(_stats())
+
+	# Worst first, the local budget starts the repos in this order
+	scores = {path: maintenance_score(result) for path, result in stats.items()}
+	selected = sorted((path for path in stats if scores[path] >= args.min_score), key=lambda p: (-scores[p], str(p)))
+	if args.limit is not None:
+		selected = selected[:args.limit]
 
-	with open(args.file) as file:
-		config = yaml.safe_load(file)
+	rate_limit = get_rate_limit(args.rate)
 
-	validator = Validator(schema.config)
+	async def _run():
+		async def _maintain(path):
+			return await maintain_repo(engine, path, stats[path], rate_limit, args.threads, args.dry_run)
 
-	if not validator.validate(config):
-		logging.error(f"Errors when validating config file '{args.file}'")
-		pprint(validator.errors)
+		async for path, output, error in engine.map(_maintain, iter(selected)):
+			result = stats[path]
+			logging.info(f"Maintain {path} (score {scores[path]}: {result.get('count', 0)} loose objects, {result.get('packs', 0)} packs)")
+			for line in output or []:
+				logging.info(f"\t{line}")
+
+			if error:
+				logging.error(f"\t{error}")
+				failed.append(path)
+
+	engine.run(_run())
+
+	logging.info(f"Maintained {len(selected) - len(failed)} repos ({len(stats) - len(selected)} skipped), {len(failed)} failed")
+	for path in sorted(failed):
+		logging.error(f"\tFailed: {path}")
+
+	if failed:
 		sys.exit(1)
 
-	config = validator.normalized(config)
 
-	remotes = get_remotes(config)
+def list_repos(engine, repos, config, args):
+	if args.local:
+		git_dirs = get_local_repos(args.prefix, args.jobs)
+
+		columns = [('name', "Name"), ('path', "Path"), ('remote', "Remote")]
+		output = get_output(args.format, columns, sort_key=lambda r: (r['name'], str(r['path'])))
 
-	repos = []
-	for remote in remotes:
-		repos += remote.get_repos()
+		for git_dir, remotes in iter_local_remotes(git_dirs, args.jobs, args.backend):
+			output.write({
+				'name': get_repo_path(git_dir).name,
+				'path': get_repo_path(git_dir),
+				'remote': [f"{name}: {url}" for name, url in remotes]
+			})
+
+	else: # remote (default)
+		columns = [('name', "Name"), ('remote', "Remote"), ('dest', "Dest")]
+		output = get_output(args.format, columns)
+
+		if not output.streaming:
+			repos = RepoInventory(repos).sorted()
+
+		for repo in repos:
+			output.write({
+				'name': repo.name,
+				'remote': repo.source,
+				'dest': Path(args.prefix) / repo.dest
+			})
+
+	output.close()
+
+
+def run_command(engine, repos, config, args):
+	if not args.profile:
+		return args.func(engine, repos, config, args)
+
+	profiler = cProfile.Profile()
+	try:
+		return profiler.runcall(args.func, engine, repos, config, args)
+	finally:
+		profiler.dump_stats(args.profile)
+		pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(20)
+
+
+# Main
+if '__name__' != '__main__':
+	args = parseArgs()
+
+	if args.timings or args.trace:
+		timings.enable()
+
+	with timings.phase('config'):
+		try:
+			config = load_config(args.file)
+		except ConfigError as e:
+			logging.error(e)
+			pprint(e.errors)
+			sys.exit(1)
 
-	repos += get_repos(config)
+	# Remote discovery yields repos while it is still running, commands
+	# iterating the repos only once (update) can start working right away
+	engine = get_engine(config, args)
+	repos = iter_repos(config, get_cache(config, args), engine.session)
 
 	if args.command:
-		args.func(repos, config, args)
+		try:
+			run_command(engine, repos, config, args)
+		finally:
+			engine.close()
+			if args.timings:
+				timings.summary()
+			if args.trace:
+				timings.write_trace(args.trace)
 	else:
 		logging.error("No or unkown subcommand... Use --help for more info on usage")
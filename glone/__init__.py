@@ -1,4 +1,5 @@
 
 from .remote import GithubRemote, GitlabRemote
 from .group import GloneGroup
-from .repo import GloneRepo
+from .repo import GloneRepo, normalize_url
+from .inventory import RepoInventory
@@ -0,0 +1,341 @@
+#/usr/bin/python3
+
+
+import os, sys
+import re
+import logging
+import threading
+import subprocess
+
+from pathlib import Path
+
+from glone.timing import timings
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+BRANCH_FORMAT = '%(HEAD)%00%(refname:short)%00%(upstream:short)%00%(upstream:track,nobracket)'
+TRACK_FORMAT = '%(refname)%00%(upstream:track,nobracket)'
+
+
+def run_git(path, *args):
+	result = subprocess.run(['git', '-C', str(path), *args], capture_output=True, text=True)
+	timings.count('processes', 1, path)
+
+	if result.returncode != 0:
+		raise RuntimeError(f"git {' '.join(args)} failed in {path}: {result.stderr.strip()}")
+
+	return result.stdout
+
+
+def resolve_git_dirs(path):
+	"""Returns the git dir and the common dir of the working tree at path.
+
+	They differ for linked worktrees, where '.git' is a file pointing to
+	the worktree's git dir and the refs live in the main repo. A bare repo
+	is its own git dir.
+	"""
+	git_dir = Path(path) / '.git'
+
+	if not git_dir.exists() and (Path(path) / 'HEAD').is_file():
+		return Path(path), Path(path)
+
+	if git_dir.is_file():
+		with open(git_dir) as file:
+			git_dir = (Path(path) / file.read().strip()[len('gitdir:'):].strip()).resolve()
+
+	common_dir = git_dir
+	if (git_dir / 'commondir').is_file():
+		with open(git_dir / 'commondir') as file:
+			common_dir = (git_dir / file.read().strip()).resolve()
+
+	return git_dir, common_dir
+
+
+def parse_git_config(path):
+	"""Minimal reader for git config files, returns {(section, subsection): {key: [values]}}.
+
+	Keys and section names are lowercased, subsections are kept as is.
+	Includes are not followed.
+	"""
+	config = {}
+	section = None
+
+	try:
+		with open(path) as file:
+			lines = file.read().splitlines()
+	except OSError:
+		return config
+
+	for line in lines:
+		line = line.strip()
+		if not line or line[0] in '#;':
+			continue
+
+		match = re.match(r'^\[\s*([^\s"\]]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]', line)
+		if match:
+			name, subsection = match.groups()
+			if subsection is None and '.' in name:
+				name, subsection = name.split('.', 1)
+			section = (name.lower(), subsection)
+			config.setdefault(section, {})
+			continue
+
+		if section is None:
+			continue
+
+		key, _, value = line.partition('=')
+		value = re.sub(r'\s[#;].*$', '', value).strip() if '"' not in value else value.strip()
+		if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+			value = value[1:-1]
+
+		config[section].setdefault(key.strip().lower(), []).append(value if _ else 'true')
+
+	return config
+
+
+def _map_refspec(refspec, ref):
+	"""Map ref through a fetch refspec ('+refs/heads/*:refs/remotes/origin/*'), None if it does not match"""
+	src, _, dst = refspec.lstrip('+').partition(':')
+
+	if '*' not in src:
+		return dst if src == ref else None
+
+	prefix, suffix = src.split('*', 1)
+	if ref.startswith(prefix) and ref.endswith(suffix):
+		middle = ref[len(prefix):len(ref) - len(suffix)]
+		return dst.replace('*', middle, 1)
+
+	return None
+
+
+class LocalRepo(object):
+	"""Handle of a local repo, refs and config are read from disk once"""
+	def __init__(self, path):
+		self.path = Path(path)
+		self.git_dir, self.common_dir = resolve_git_dirs(self.path)
+		self._config = None
+		self._refs = None
+
+
+	@property
+	def config(self):
+		if self._config is None:
+			self._config = parse_git_config(self.common_dir / 'config')
+
+		return self._config
+
+
+	@property
+	def refs(self):
+		"""All refs of the repo as {refname: sha}, loose refs override packed ones"""
+		if self._refs is None:
+			refs = {}
+
+			try:
+				with open(self.common_dir / 'packed-refs') as file:
+					for line in file:
+						if line[0] in '#^':
+							continue
+						sha, _, ref = line.strip().partition(' ')
+						refs[ref] = sha
+			except OSError:
+				pass
+
+			refs_dir = self.common_dir / 'refs'
+			for root, dirs, files in os.walk(refs_dir):
+				for name in files:
+					path = Path(root) / name
+					try:
+						sha = path.read_text().strip()
+					except OSError:
+						continue
+					if re.match(r'^[0-9a-f]{40,64}$', sha):
+						refs[path.relative_to(self.common_dir).as_posix()] = sha
+
+			self._refs = refs
+
+		return self._refs
+
+
+	def head(self):
+		"""Returns the ref HEAD points to, None if detached"""
+		try:
+			head = (self.git_dir / 'HEAD').read_text().strip()
+		except OSError:
+			return None
+
+		return head[len('ref: '):] if head.startswith('ref: ') else None
+
+
+	def remotes(self):
+		return [
+			(subsection, values['url'][-1])
+			for (section, subsection), values in self.config.items()
+			if section == 'remote' and subsection and 'url' in values
+		]
+
+
+	def upstream(self, branch):
+		"""Returns (short name, ref) of the upstream of branch, (None, None) if it does not track one"""
+		values = self.config.get(('branch', branch), {})
+		if 'remote' not in values or 'merge' not in values:
+			return None, None
+
+		remote = values['remote'][-1]
+		merge = values['merge'][-1]
+
+		if remote == '.':
+			return merge[len('refs/heads/'):] if merge.startswith('refs/heads/') else merge, merge
+
+		for refspec in self.config.get(('remote', remote), {}).get('fetch', []):
+			ref = _map_refspec(refspec, merge)
+			if ref:
+				short = ref[len('refs/remotes/'):] if ref.startswith('refs/remotes/') else ref
+				return short, ref
+
+		return None, None
+
+
+class GitBackend(object):
+	"""Answers read-only questions about local repos.
+
+	branches() returns a list of (is_head, branch, upstream, divergence)
+	sorted by branch name, divergence is a (behind, ahead) tuple or None
+	if the upstream is gone.
+	"""
+	def remotes(self, path):
+		raise NotImplementedError
+
+
+	def branches(self, path):
+		raise NotImplementedError
+
+
+	def status(self, path):
+		"""Returns the 'git status --porcelain' lines of the repo at path"""
+		return run_git(path, 'status', '--porcelain').splitlines()
+
+
+class SubprocessBackend(GitBackend):
+	"""Backend running one git process per query"""
+	def remotes(self, path):
+		result = subprocess.run(['git', '-C', str(path), 'config', '--get-regexp', r'^remote\..*\.url$'], capture_output=True, text=True)
+		timings.count('processes', 1, path)
+
+		# Exit code 1 means no remote is configured
+		if result.returncode not in (0, 1):
+			raise RuntimeError(f"git config failed in {path}: {result.stderr.strip()}")
+
+		remotes = []
+		for line in result.stdout.splitlines():
+			key, _, url = line.partition(' ')
+			remotes.append((key[len('remote.'):-len('.url')], url))
+
+		return remotes
+
+
+	def branches(self, path):
+		branches = []
+
+		for line in run_git(path, 'for-each-ref', f'--format={BRANCH_FORMAT}', 'refs/heads').splitlines():
+			head, name, upstream, track = line.split('\0')
+			branches.append((head == '*', name, upstream, self._parse_track(track) if upstream else None))
+
+		return branches
+
+
+	@staticmethod
+	def _parse_track(track):
+		"""Parse '%(upstream:track,nobracket)', returns (behind, ahead) or None if the upstream is gone"""
+		if track == 'gone':
+			return None
+
+		counts = {'ahead': 0, 'behind': 0}
+		for part in track.split(','):
+			if part.strip():
+				key, value = part.split()
+				counts[key] = int(value)
+
+		return counts['behind'], counts['ahead']
+
+
+class NativeBackend(GitBackend):
+	"""Backend reading refs and config from disk.
+
+	Repo handles are cached per path for the length of the run. Branches
+	pointing to the same commit as their upstream need no history walk.
+	The divergence of the others is left to git, with committer dates out
+	of order only a walk of the whole history would be exact, and counted
+	by a single 'git for-each-ref' for all branches of the repo.
+	"""
+	def __init__(self):
+		self._repos = {}
+		self._lock = threading.Lock()
+
+
+	def open(self, path):
+		path = Path(path)
+
+		with self._lock:
+			if path not in self._repos:
+				self._repos[path] = LocalRepo(path)
+
+			return self._repos[path]
+
+
+	def remotes(self, path):
+		return self.open(path).remotes()
+
+
+	def _tracks(self, path):
+		"""Divergence of every branch from its upstream as {ref: (behind, ahead) or None}"""
+		tracks = {}
+
+		for line in run_git(path, 'for-each-ref', f'--format={TRACK_FORMAT}', 'refs/heads').splitlines():
+			ref, track = line.split('\0')
+			tracks[ref] = SubprocessBackend._parse_track(track)
+
+		return tracks
+
+
+	def branches(self, path):
+		repo = self.open(path)
+		refs = repo.refs
+		head = repo.head()
+		tracks = None
+
+		branches = []
+		for ref in sorted(r for r in refs if r.startswith('refs/heads/')):
+			name = ref[len('refs/heads/'):]
+			upstream, upstream_ref = repo.upstream(name)
+
+			divergence = None
+			if upstream_ref in refs:
+				if refs[upstream_ref] == refs[ref]:
+					divergence = (0, 0)
+				else:
+					if tracks is None:
+						tracks = self._tracks(path)
+					divergence = tracks.get(ref)
+
+			branches.append((ref == head, name, upstream or "", divergence))
+
+		return branches
+
+
+BACKENDS = {
+	'native': NativeBackend,
+	'git': SubprocessBackend,
+}
+
+_backends = {}
+
+
+def get_backend(name='native'):
+	"""Shared backend instance of the given kind, repo handles live as long as the run"""
+	if name not in _backends:
+		_backends[name] = BACKENDS[name]()
+
+	return _backends[name]
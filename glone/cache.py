@@ -0,0 +1,90 @@
+#/usr/bin/python3
+
+
+import os, sys
+import time
+import hashlib
+import logging
+
+from pathlib import Path
+
+from glone.scanner import load_json, store_json
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+# Project attributes kept in the cache, everything else returned by the API is dropped
+CACHED_ATTRIBUTES = [
+	'id',
+	'name',
+	'path',
+	'path_with_namespace',
+	'ssh_url_to_repo',
+	'http_url_to_repo',
+	'last_activity_at',
+	'archived',
+	'visibility',
+	'forked_from_project',
+]
+
+
+def project_attributes(project):
+	attributes = {key: project.attributes.get(key) for key in CACHED_ATTRIBUTES}
+
+	# Only the path of the fork parent is needed, not the whole project
+	if attributes['forked_from_project']:
+		attributes['forked_from_project'] = {'path_with_namespace': attributes['forked_from_project'].get('path_with_namespace')}
+
+	return attributes
+
+
+def default_cache_dir():
+	return Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'glone'
+
+
+class RemoteCache(object):
+	"""On-disk cache of remote inventories.
+
+	Entries are keyed by remote id, kind ('group', 'user' or 'discovery')
+	and source. An entry is fresh for ttl seconds, after that the remote
+	is expected to revalidate it. In offline mode entries are used
+	regardless of their age, with refresh they are never used.
+	"""
+	def __init__(self, path, ttl, offline=False, refresh=False):
+		self.path = Path(path)
+		self.ttl = ttl
+		self.offline = offline
+		self.refresh = refresh
+
+
+	def _file(self, remote_id, kind, source):
+		digest = hashlib.sha1(str(source).encode()).hexdigest()
+		return self.path / str(remote_id) / f"{kind}-{digest}.json"
+
+
+	def load(self, remote_id, kind, source):
+		if self.refresh:
+			return None
+
+		return load_json(self._file(remote_id, kind, source))
+
+
+	def store(self, remote_id, kind, source, items, timestamp=None):
+		entry = {
+			'source': str(source),
+			'timestamp': timestamp or time.time(),
+			'items': items,
+		}
+
+		store_json(self._file(remote_id, kind, source), entry)
+
+		return entry
+
+
+	def is_fresh(self, entry):
+		if entry is None:
+			return False
+
+		return self.offline or time.time() - entry['timestamp'] < self.ttl
+
@@ -0,0 +1,103 @@
+#/usr/bin/python3
+
+
+import os, sys
+import hashlib
+import json
+import logging
+
+from pathlib import Path
+
+import yaml
+
+from cerberus import Validator
+
+from glone import schema
+from glone.cache import default_cache_dir
+from glone.scanner import load_json, store_json
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+CONFIG_CACHE_VERSION = 3
+
+# libyaml's loader is an order of magnitude faster, it is not available everywhere
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Changes to the schema invalidate cached configs
+SCHEMA_DIGEST = hashlib.sha256(repr([schema.config, schema.remote, schema.group, schema.repo]).encode()).digest()
+
+_validators = {}
+_defaults = {}
+
+
+class ConfigError(Exception):
+	"""Raised by load_config if the config file does not match the schema"""
+	def __init__(self, path, errors):
+		super().__init__(f"Errors when validating config file '{path}'")
+		self.errors = errors
+
+
+def get_validator(name):
+	"""Validator of the schema with the given name ('config', 'remote', 'group', 'repo'), compiled once"""
+	if name not in _validators:
+		_validators[name] = Validator(getattr(schema, name))
+
+	return _validators[name]
+
+
+def get_defaults(name):
+	"""Defaults of the schema with the given name, computed once.
+
+	The returned dict is shared, callers have to copy it before changing it.
+	Its values are shared as well and must not be modified in place.
+	"""
+	if name not in _defaults:
+		_defaults[name] = get_validator(name).normalized({})
+
+	return _defaults[name]
+
+
+def _cache_file(path):
+	digest = hashlib.sha1(str(Path(path).resolve()).encode()).hexdigest()
+	return default_cache_dir() / 'config' / f"{digest}.json"
+
+
+def load_config(path, use_cache=True):
+	"""Read, validate and normalize the config file at path.
+
+	The normalized config is cached as JSON keyed by the hash of the file
+	content and of the schema, unchanged config files are neither parsed
+	nor validated again. The cache holds the auth tokens, it is only
+	readable by the user. Raises ConfigError if the config is invalid.
+	"""
+	with open(path, 'rb') as file:
+		data = file.read()
+
+	digest = hashlib.sha256(data + SCHEMA_DIGEST).hexdigest()
+	cache_file = _cache_file(path)
+
+	if use_cache:
+		entry = load_json(cache_file, CONFIG_CACHE_VERSION)
+		if entry and entry.get('digest') == digest:
+			return entry['config']
+
+	config = yaml.load(data, Loader=YamlLoader)
+
+	# validate() normalizes as well, the result is kept in validator.document
+	validator = get_validator('config')
+	if not validator.validate(config):
+		raise ConfigError(path, validator.errors)
+
+	config = validator.document
+
+	if use_cache:
+		try:
+			# Values JSON does not keep as they are (e.g. non-string keys) would come back changed
+			if json.loads(json.dumps(config)) == config:
+				store_json(cache_file, {'digest': digest, 'config': config}, CONFIG_CACHE_VERSION, private=True)
+		except (OSError, TypeError, ValueError) as e:
+			logging.debug(f"Unable to cache config {path}: {e}")
+
+	return config
@@ -0,0 +1,260 @@
+#/usr/bin/python3
+
+
+import os, sys
+import asyncio
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from glone.config import get_defaults
+from glone.limits import HostLimiter, LimitedAdapter, is_transient
+from glone.timing import timings
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+# git commands talking to a remote, they run on the 'network' budget
+NETWORK_COMMANDS = {'clone', 'fetch', 'pull', 'push', 'ls-remote', 'remote', 'submodule'}
+
+_DONE = object()
+
+
+class CommandError(RuntimeError):
+	"""Raised by Engine.command if the command exits with a non-zero status or times out"""
+	def __init__(self, args, returncode, stderr):
+		if returncode is None:
+			super().__init__(f"{' '.join(args)} timed out {stderr.strip()}")
+		else:
+			super().__init__(f"{' '.join(args)} failed ({returncode}): {stderr.strip()}")
+		self.args_list = args
+		self.returncode = returncode
+		self.stderr = stderr
+
+
+class GitError(CommandError):
+	"""Raised by Engine.git if git exits with a non-zero status"""
+	def __init__(self, args, returncode, stderr):
+		super().__init__(['git', *args], returncode, stderr)
+
+
+def default_limits():
+	"""Default 'limits' section of the config"""
+	return get_defaults('config')['limits']
+
+
+def get_budget(args):
+	"""Budget a git command runs on, 'network' if it talks to a remote, 'local' otherwise"""
+	return 'network' if args and args[0] in NETWORK_COMMANDS else 'local'
+
+
+class Engine(object):
+	"""asyncio execution core of a run.
+
+	Work is scheduled on one event loop and limited by separate budgets:
+	'api' for requests to the remotes, 'network' for git commands talking to
+	a remote and 'local' for git commands and reads on local repos. git runs
+	as asyncio subprocesses, so waiting on thousands of them needs no
+	threads. Blocking library calls (python-gitlab, the local backends) run
+	on a shared thread pool sized to the budgets.
+
+	The API budget is also enforced on the shared HTTP session: its
+	connection pool holds at most 'api' connections and blocks when all of
+	them are in use, so concurrent remotes reuse the same keep-alive
+	connections instead of opening new ones.
+
+	Requests and network git commands are rate limited per host and
+	retried on transient errors as configured in the 'limits' section of
+	the config. SSH connections are shared between git commands through
+	an ssh ControlMaster unless disabled or GIT_SSH_COMMAND is already set.
+	"""
+	def __init__(self, api=4, network=4, local=None, limits=None):
+		self.limits = {
+			'api': max(1, api),
+			'network': max(1, network),
+			'local': max(1, local or os.cpu_count() or 1),
+		}
+		self.limiter = HostLimiter(limits or default_limits())
+		self._env = self._git_env(self.limiter.limits)
+		self._semaphores = {}
+		self._executor = ThreadPoolExecutor(max_workers=self.limits['api'] + self.limits['local'])
+		self._session = None
+		self._session_lock = threading.Lock()
+
+
+	@staticmethod
+	def _git_env(limits):
+		"""Environment of git processes, sets up ssh connection sharing"""
+		env = dict(os.environ)
+
+		if not limits['ssh_multiplex'] or 'GIT_SSH_COMMAND' in env or 'GIT_SSH' in env:
+			return env
+
+		# Control sockets need a short path (sun_path is limited to ~100 bytes)
+		control_dir = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/tmp', f"glone-ssh-{os.getuid()}")
+		try:
+			os.makedirs(control_dir, mode=0o700, exist_ok=True)
+		except OSError as e:
+			logging.debug(f"Unable to create ssh control directory {control_dir}: {e}")
+			return env
+
+		env['GIT_SSH_COMMAND'] = f"ssh -o ControlMaster=auto -o ControlPath={control_dir}/%C -o ControlPersist={limits['ssh_persist']}"
+
+		return env
+
+
+	def _semaphore(self, budget):
+		# Created on first use so they are bound to the running loop
+		if budget not in self._semaphores:
+			self._semaphores[budget] = asyncio.Semaphore(self.limits[budget])
+
+		return self._semaphores[budget]
+
+
+	@property
+	def session(self):
+		"""HTTP session shared by all remotes, its pool is limited to the API budget"""
+		with self._session_lock:
+			if self._session is None:
+				adapter = LimitedAdapter(self.limiter, pool_connections=self.limits['api'], pool_maxsize=self.limits['api'], pool_block=True)
+				self._session = requests.Session()
+				self._session.mount('https://', adapter)
+				self._session.mount('http://', adapter)
+
+		return self._session
+
+
+	def run(self, coroutine):
+		"""Run coroutine on a new event loop until it completes"""
+		try:
+			return asyncio.run(coroutine)
+		finally:
+			self._semaphores = {}
+
+
+	def close(self):
+		self._executor.shutdown(wait=False)
+		if self._session is not None:
+			self._session.close()
+
+
+	async def _execute(self, args, cwd, budget, timeout):
+		"""Run args within budget, returns (returncode, stdout, stderr), returncode is None on timeout"""
+		async with self._semaphore(budget):
+			process = await asyncio.create_subprocess_exec(
+				*args,
+				cwd=None if cwd is None else str(cwd),
+				env=self._env,
+				stdin=asyncio.subprocess.DEVNULL,
+				stdout=asyncio.subprocess.PIPE,
+				stderr=asyncio.subprocess.PIPE
+			)
+
+			try:
+				stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+			except asyncio.TimeoutError:
+				process.kill()
+				await process.wait()
+				return None, "", f"after {timeout}s"
+
+		return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+
+	async def command(self, *args, cwd=None, budget='local', timeout=None, repo=None):
+		"""Run any command, returns its stdout without the trailing newline"""
+		returncode, stdout, stderr = await self._execute(args, cwd, budget, timeout)
+		timings.count('processes', 1, repo)
+
+		if returncode != 0:
+			raise CommandError(list(args), returncode, stderr)
+
+		return stdout.rstrip('\n')
+
+
+	async def git(self, *args, cwd=None, budget=None, repo=None, host=None, timeout=None):
+		"""Run git with args in cwd, returns its stdout without the trailing newline.
+
+		The budget defaults to 'network' for commands talking to a remote and
+		'local' for everything else. Commands on the network budget wait for
+		the rate limit of host and are retried on transient errors.
+		"""
+		budget = budget or get_budget(args)
+		network = budget == 'network'
+		attempt = 0
+
+		while True:
+			if network:
+				await asyncio.sleep(self.limiter.reserve(host))
+
+			returncode, stdout, stderr = await self._execute(('git', *args), cwd, budget, timeout)
+			timings.count('processes', 1, repo)
+
+			if returncode == 0:
+				return stdout.rstrip('\n')
+
+			if returncode is None or not network or attempt >= self.limiter.retries or not is_transient(stderr):
+				raise GitError(list(args), returncode, stderr)
+
+			delay = self.limiter.backoff(attempt)
+			logging.warning(f"git {args[0]} on {host or 'local remote'} failed ({stderr.strip().splitlines()[-1]}), retrying in {delay:.1f}s")
+			timings.count('retries', 1, repo)
+			await asyncio.sleep(delay)
+			attempt += 1
+
+
+	async def call(self, budget, func, *args):
+		"""Run the blocking func(*args) on the thread pool within budget"""
+		async with self._semaphore(budget):
+			return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+
+	async def map(self, func, items, on_exhausted=None):
+		"""Run the coroutine func(item) for every item concurrently.
+
+		Yields (item, result, error) tuples in completion order, like
+		run_parallel. items may be a blocking iterator (e.g. repos streamed
+		from the remotes), it is advanced on the thread pool and work starts
+		while it is still producing. Concurrency is limited by the budgets
+		func uses, not by the number of items. on_exhausted is called once
+		no more items are taken from items, also if advancing it raised, so
+		work waiting for the end of the items is released.
+		"""
+		loop = asyncio.get_running_loop()
+		queue = asyncio.Queue()
+
+		async def _run(item):
+			try:
+				result = await func(item)
+			except Exception as e:
+				await queue.put((item, None, e))
+			else:
+				await queue.put((item, result, None))
+
+		async def _produce():
+			tasks = []
+			try:
+				iterator = iter(items)
+				while True:
+					item = await loop.run_in_executor(self._executor, next, iterator, _DONE)
+					if item is _DONE:
+						break
+					tasks.append(asyncio.create_task(_run(item)))
+			finally:
+				if on_exhausted:
+					on_exhausted()
+				await asyncio.gather(*tasks)
+				await queue.put(_DONE)
+
+		producer = asyncio.create_task(_produce())
+
+		while True:
+			entry = await queue.get()
+			if entry is _DONE:
+				break
+			yield entry
+
+		await producer
@@ -0,0 +1,137 @@
+#/usr/bin/python3
+
+
+import os, sys
+import logging
+
+import requests
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+GITHUB_GRAPHQL_URL = 'https://api.github.com/graphql'
+
+PER_PAGE = 100
+
+# First pages of this many owners are requested in one query
+OWNERS_PER_QUERY = 10
+
+REPOSITORY_FIELDS = "databaseId name nameWithOwner sshUrl url pushedAt isArchived visibility parent { nameWithOwner }"
+
+
+class GraphQLError(RuntimeError):
+	"""Raised if a GraphQL response carries errors other than missing owners"""
+	def __init__(self, errors):
+		super().__init__("; ".join(error.get('message', str(error)) for error in errors))
+		self.errors = errors
+
+
+def repository_attributes(node):
+	"""Project attributes (as cached for GitLab projects) of a GitHub repository node"""
+	parent = node.get('parent') or {}
+
+	return {
+		'id': node['databaseId'],
+		'name': node['name'],
+		'path': node['name'],
+		'path_with_namespace': node['nameWithOwner'],
+		'ssh_url_to_repo': node['sshUrl'],
+		'http_url_to_repo': f"{node['url']}.git",
+		'last_activity_at': node.get('pushedAt'),
+		'archived': node.get('isArchived', False),
+		'visibility': (node.get('visibility') or '').lower() or None,
+		'forked_from_project': {'path_with_namespace': parent['nameWithOwner']} if parent else None,
+	}
+
+
+def repository_arguments(filters):
+	"""Arguments of the repositories connection for the filters GraphQL supports (archived, visibility)"""
+	arguments = ""
+
+	if filters.get('archived') is not None:
+		arguments += f", isArchived: {'true' if filters['archived'] else 'false'}"
+
+	if filters.get('visibility'):
+		arguments += f", visibility: {filters['visibility'].upper()}"
+
+	return arguments
+
+
+def owners_query(filters):
+	"""Query for one page of the repositories of len(filters) owners, as aliases o0, o1, ..."""
+	declarations = ", ".join(f"$login{i}: String!, $cursor{i}: String" for i in range(len(filters)))
+	owners = " ".join(
+		f"o{i}: repositoryOwner(login: $login{i}) {{ "
+		f"repositories(first: {PER_PAGE}, after: $cursor{i}{repository_arguments(owner_filters)}, ownerAffiliations: OWNER, orderBy: {{field: NAME, direction: ASC}}) {{ "
+		f"totalCount pageInfo {{ hasNextPage endCursor }} nodes {{ {REPOSITORY_FIELDS} }} }} }}"
+		for i, owner_filters in enumerate(filters)
+	)
+
+	return f"query({declarations}) {{ {owners} }}"
+
+
+ORGANIZATIONS_QUERY = (
+	"query($cursor: String) { viewer { "
+	f"organizations(first: {PER_PAGE}, after: $cursor) {{ pageInfo {{ hasNextPage endCursor }} nodes {{ login name }} }} "
+	"} }"
+)
+
+
+class GithubClient(object):
+	"""Minimal client of the GitHub GraphQL API.
+
+	Requests go through session, so they share the connection pool, rate
+	limits and retries of the other remotes.
+	"""
+	def __init__(self, url, token, session=None):
+		self.url = url
+		self.session = session or requests.Session()
+		self._headers = {'Authorization': f"bearer {token}"}
+
+
+	def query(self, query, variables=None):
+		response = self.session.post(self.url, json={'query': query, 'variables': variables or {}}, headers=self._headers)
+		response.raise_for_status()
+		result = response.json()
+
+		errors = result.get('errors') or []
+		for error in errors:
+			if error.get('type') == 'NOT_FOUND':
+				logging.warning(f"GitHub: {error.get('message')}")
+
+		if result.get('data') is None or any(error.get('type') != 'NOT_FOUND' for error in errors):
+			raise GraphQLError(errors or [{'message': 'Response without data'}])
+
+		return result['data']
+
+
+	def repositories(self, owners):
+		"""One page of repositories for every (login, cursor, filters) in owners.
+
+		Returns a list with one connection ({'nodes', 'pageInfo', 'totalCount'})
+		per owner, None for owners that do not exist.
+		"""
+		variables = {}
+		for i, (login, cursor, filters) in enumerate(owners):
+			variables[f"login{i}"] = login
+			variables[f"cursor{i}"] = cursor
+
+		data = self.query(owners_query([filters for login, cursor, filters in owners]), variables)
+
+		return [(data.get(f"o{i}") or {}).get('repositories') for i in range(len(owners))]
+
+
+	def organizations(self):
+		"""Organizations of the authenticated user as [{'path', 'name'}]"""
+		organizations = []
+		cursor = None
+
+		while True:
+			connection = self.query(ORGANIZATIONS_QUERY, {'cursor': cursor})['viewer']['organizations']
+			organizations += [{'path': node['login'], 'name': node['name'] or node['login']} for node in connection['nodes']]
+
+			if not connection['pageInfo']['hasNextPage']:
+				return organizations
+
+			cursor = connection['pageInfo']['endCursor']
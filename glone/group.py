@@ -5,18 +5,57 @@ import os, sys
 import re
 import logging
 
-from cerberus import Validator
-
-from glone import schema
+from glone.config import get_defaults
 
 
 
 logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
 
 
+# Project filters the GitLab API applies on the server
+FILTERS = ['archived', 'visibility', 'search', 'last_activity_after', 'min_access_level']
+
+# Flags of a pattern without inline flags
+DEFAULT_FLAGS = re.compile('').flags
+
+
+def compile_patterns(patterns):
+	"""Function telling if a name matches (at the start, like re.match) any of patterns, None if there are none.
+
+	The patterns are joined into one regex unless one of them has groups,
+	whose backreferences would be renumbered, or global inline flags like
+	(?i), which would apply to every pattern. Those are matched one by one.
+	"""
+	if not patterns:
+		return None
+
+	compiled = [re.compile(pattern) for pattern in patterns]
+
+	if all(regex.groups == 0 and regex.flags == DEFAULT_FLAGS for regex in compiled):
+		combined = re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+		return lambda name: combined.match(name) is not None
+
+	return lambda name: any(regex.match(name) is not None for regex in compiled)
+
+
+def make_matcher(includes=(), excludes=()):
+	"""Returns a function telling if a name passes the include and exclude patterns.
+
+	A name passes if it matches any include (or there are none) and no
+	exclude. The patterns of each list are compiled once.
+	"""
+	include = compile_patterns(includes)
+	exclude = compile_patterns(excludes)
+
+	def matches(name):
+		return (include is None or include(name)) and (exclude is None or not exclude(name))
+
+	return matches
+
+
 class GloneGroup(object):
 	def __init__(self, group_config, default_config):
-		norm_group = Validator(schema.group).normalized({})
+		norm_group = get_defaults('group')
 		self.__dict__.update(**norm_group)
 
 		self.__dict__.update(default_config['groups'])
@@ -34,6 +73,13 @@ class GloneGroup(object):
 		if 'dest' not in group_config:
 			self.dest = self.id
 
+		self.matches = make_matcher(self.includes, self.excludes)
+
+
+	def filters(self):
+		"""The project filters set for this group"""
+		return {key: getattr(self, key) for key in FILTERS if getattr(self, key, None) is not None}
+
 
 	def __str__(self):
 		return f"{self.__dict__}"
@@ -0,0 +1,70 @@
+#/usr/bin/python3
+
+
+import os, sys
+import logging
+
+from glone.repo import normalize_url
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+
+class RepoInventory(object):
+	"""Collection of repos indexed by id, source and dest.
+
+	Sources are indexed by their normalized url, so the ssh and https urls
+	of a repo find the same entries. Ids are compared as strings, as they
+	are written in the config. Ids are only unique per remote and a
+	project may be listed by several groups, lookups by id and source
+	return lists. The sort order by name is computed once and kept until
+	repos are added.
+	"""
+	def __init__(self, repos=()):
+		self._repos = []
+		self._by_id = {}
+		self._by_source = {}
+		self._by_dest = {}
+		self._sorted = None
+
+		for repo in repos:
+			self.add(repo)
+
+
+	def add(self, repo):
+		self._repos.append(repo)
+		self._by_id.setdefault(str(repo.id), []).append(repo)
+		self._by_source.setdefault(normalize_url(repo.source), []).append(repo)
+		self._by_dest.setdefault(str(repo.dest), repo)
+		self._sorted = None
+
+
+	def __len__(self):
+		return len(self._repos)
+
+
+	def __iter__(self):
+		return iter(self._repos)
+
+
+	def sorted(self):
+		"""Repos sorted by name and dest"""
+		if self._sorted is None:
+			keys = [(repo.name, str(repo.dest)) for repo in self._repos]
+			self._sorted = [self._repos[i] for i in sorted(range(len(keys)), key=keys.__getitem__)]
+
+		return self._sorted
+
+
+	def find_by_id(self, repo_id):
+		return self._by_id.get(str(repo_id), [])
+
+
+	def find_by_source(self, url):
+		return self._by_source.get(normalize_url(url), [])
+
+
+	def get_by_dest(self, dest):
+		"""Repo cloned to dest, the first one if several repos share it"""
+		return self._by_dest.get(str(dest))
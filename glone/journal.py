@@ -0,0 +1,120 @@
+#/usr/bin/python3
+
+
+import os, sys
+import json
+import time
+import logging
+
+from pathlib import Path
+
+from glone.scanner import STATE_DIR
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+JOURNAL_FILE = 'journal.jsonl'
+JOURNAL_VERSION = 1
+
+JOURNAL_MODES = ['resume', 'retry-failed']
+
+
+class RunJournal(object):
+	"""Append-only progress log of the last update run.
+
+	Stored as JSON lines in <prefix>/.glone/journal.jsonl. Every finished
+	step of a repo (its clone or one of its tasks) and the final status of
+	every repo is appended and flushed right away, so the journal survives
+	the run being killed. A new run truncates it, a resumed run ('resume'
+	continues unfinished repos, 'retry-failed' reruns failed ones) appends
+	to it and skips the steps already done.
+	"""
+	def __init__(self, prefix):
+		self.path = Path(prefix) / STATE_DIR / JOURNAL_FILE
+		self.mode = None
+		self.repos = {}
+		self._file = None
+
+
+	def _load(self):
+		repos = {}
+
+		try:
+			with open(self.path) as file:
+				lines = file.read().splitlines()
+		except OSError:
+			return repos
+
+		for line in lines:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				# A killed run may leave a partial last line
+				continue
+
+			if record.get('event') == 'start' and record.get('version') != JOURNAL_VERSION:
+				return {}
+
+			if 'repo' in record:
+				entry = repos.setdefault(record['repo'], {'status': None, 'steps': []})
+				if record['event'] == 'step':
+					entry['steps'].append(record['step'])
+				elif record['event'] == 'repo':
+					entry['status'] = record['status']
+
+		return repos
+
+
+	def _write(self, record):
+		self._file.write(json.dumps(record) + '\n')
+		self._file.flush()
+
+
+	def open(self, mode=None, dry_run=False):
+		"""Start a new run, or continue the last one in the given mode. Dry runs only read the journal"""
+		self.mode = mode
+		self.repos = self._load() if mode else {}
+
+		if mode and not self.repos:
+			logging.warning(f"No previous run found in {self.path}, nothing to {mode.replace('-', ' ')}")
+
+		if dry_run:
+			return
+
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+
+		self._file = open(self.path, 'a' if mode else 'w')
+		self._write({'event': 'start' if not mode else mode, 'version': JOURNAL_VERSION, 'time': time.time()})
+
+
+	def close(self):
+		if self._file is not None:
+			self._write({'event': 'end', 'time': time.time()})
+			self._file.close()
+			self._file = None
+
+
+	def select(self, key):
+		"""Steps of repo key done by the last run, None if the repo is not part of this run"""
+		entry = self.repos.get(key)
+
+		if self.mode == 'resume':
+			if entry and entry['status'] is not None:
+				return None
+
+		elif self.mode == 'retry-failed':
+			if not entry or entry['status'] != 'failed':
+				return None
+
+		return set(entry['steps']) if entry else set()
+
+
+	def step(self, key, step):
+		if self._file is not None:
+			self._write({'event': 'step', 'repo': key, 'step': step})
+
+
+	def finish(self, key, status):
+		if self._file is not None:
+			self._write({'event': 'repo', 'repo': key, 'status': status})
@@ -0,0 +1,196 @@
+#/usr/bin/python3
+
+
+import os, sys
+import re
+import time
+import random
+import logging
+import threading
+
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from glone.repo import normalize_url
+from glone.timing import timings
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+# HTTP status codes worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# git stderr messages of errors worth retrying (connection refused by sshd MaxStartups, resets, server errors)
+TRANSIENT_GIT_ERRORS = re.compile('|'.join([
+	r'kex_exchange_identification',
+	r'ssh_exchange_identification',
+	r'Connection (reset|refused|closed|timed out)',
+	r'Operation timed out',
+	r'Could not resolve host',
+	r'Temporary failure in name resolution',
+	r'remote end hung up unexpectedly',
+	r'early EOF',
+	r'RPC failed',
+	r'HTTP (429|5\d\d)',
+	r'returned error: (429|5\d\d)',
+	r'Too many',
+]), re.IGNORECASE)
+
+
+def get_host(url):
+	"""Host of a repo or API url, None for local paths"""
+	if '://' in url:
+		return urlparse(url).hostname
+
+	normalized = normalize_url(url)
+	if normalized.startswith('/') or '/' not in normalized or os.path.exists(url):
+		return None
+
+	return normalized.split('/', 1)[0]
+
+
+def is_transient(stderr):
+	return bool(TRANSIENT_GIT_ERRORS.search(stderr or ""))
+
+
+def retry_after(response):
+	"""Seconds to wait given by the Retry-After header of response, None if missing"""
+	value = response.headers.get('Retry-After')
+	if not value:
+		return None
+
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+
+	try:
+		return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+	except (TypeError, ValueError):
+		return None
+
+
+class TokenBucket(object):
+	"""Token bucket allowing rate operations per second with bursts of up to burst.
+
+	reserve() takes a token and returns how long the caller has to wait
+	before using it, tokens may be taken ahead of time so waiting callers
+	are served in order. pause() blocks the bucket (e.g. for Retry-After).
+	A rate of 0 disables the limit.
+	"""
+	def __init__(self, rate, burst):
+		self.rate = rate
+		self.burst = burst
+		self._tokens = burst
+		self._updated = time.monotonic()
+		self._paused_until = 0.0
+		self._lock = threading.Lock()
+
+
+	def reserve(self):
+		with self._lock:
+			now = time.monotonic()
+			wait = max(0.0, self._paused_until - now)
+
+			if self.rate:
+				self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+				self._updated = now
+				self._tokens -= 1
+				if self._tokens < 0:
+					wait = max(wait, -self._tokens / self.rate)
+
+			return wait
+
+
+	def pause(self, seconds):
+		with self._lock:
+			self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class HostLimiter(object):
+	"""Per-host rate limits and retry policy shared by API requests and git commands.
+
+	Every host gets its own token bucket, configured by the 'limits'
+	section of the config (rate and burst, overridable per host). Retries
+	wait a jittered exponential backoff ("full jitter": a random delay up
+	to backoff * 2^attempt, capped at max_backoff).
+	"""
+	def __init__(self, limits):
+		self.limits = limits
+		self.retries = limits['retries']
+		self._buckets = {}
+		self._lock = threading.Lock()
+
+
+	def bucket(self, host):
+		with self._lock:
+			if host not in self._buckets:
+				host_limits = {**self.limits, **self.limits['hosts'].get(host, {})}
+				self._buckets[host] = TokenBucket(host_limits['rate'], host_limits['burst'])
+
+			return self._buckets[host]
+
+
+	def reserve(self, host):
+		"""Seconds to wait before the next operation on host, 0 for local repos"""
+		if host is None:
+			return 0.0
+
+		return self.bucket(host).reserve()
+
+
+	def pause(self, host, seconds):
+		if host is not None:
+			self.bucket(host).pause(seconds)
+
+
+	def backoff(self, attempt):
+		return random.uniform(0, min(self.limits['max_backoff'], self.limits['backoff'] * 2 ** attempt))
+
+
+class LimitedAdapter(HTTPAdapter):
+	"""HTTP adapter applying the host limits to every request of a session.
+
+	Connection errors and responses with a status in RETRY_STATUS are
+	retried, a Retry-After header pauses the whole host instead of only the
+	failed request.
+	"""
+	def __init__(self, limiter, **kwargs):
+		self.limiter = limiter
+		super().__init__(**kwargs)
+
+
+	def send(self, request, **kwargs):
+		host = urlparse(request.url).hostname
+		attempt = 0
+
+		while True:
+			time.sleep(self.limiter.reserve(host))
+
+			try:
+				response = super().send(request, **kwargs)
+			except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+				if attempt >= self.limiter.retries:
+					raise
+				delay = self.limiter.backoff(attempt)
+				logging.warning(f"Request to {host} failed ({e}), retrying in {delay:.1f}s")
+			else:
+				if response.status_code not in RETRY_STATUS or attempt >= self.limiter.retries:
+					return response
+
+				delay = retry_after(response)
+				if delay is not None:
+					self.limiter.pause(host, delay)
+				else:
+					delay = self.limiter.backoff(attempt)
+				logging.warning(f"Request to {host} returned {response.status_code}, retrying in {delay:.1f}s")
+				response.close()
+
+			timings.count('retries', 1)
+			time.sleep(delay)
+			attempt += 1
@@ -0,0 +1,145 @@
+#/usr/bin/python3
+
+
+import os, sys
+import logging
+import asyncio
+
+from pathlib import Path
+
+from glone.backend import resolve_git_dirs
+from glone.limits import TokenBucket
+from glone.timing import timings
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+# Weights of the pack stats in the score, a repo with a higher score is maintained first
+PACK_WEIGHT = 100
+GARBAGE_WEIGHT = 10
+MISSING_INDEX_WEIGHT = 50
+
+# Batch size of 'multi-pack-index repack' is capped like 'git maintenance' does
+MAX_BATCH_SIZE = 2 * 1024 ** 3
+
+# The builtin fsmonitor daemon only exists on these platforms
+FSMONITOR_PLATFORMS = ('darwin', 'win32')
+
+
+def parse_count_objects(output):
+	"""Stats of 'git count-objects -v' as {key: int}, e.g. 'count', 'in-pack', 'packs', 'garbage'"""
+	stats = {}
+
+	for line in output.splitlines():
+		key, _, value = line.partition(':')
+		try:
+			stats[key.strip()] = int(value)
+		except ValueError:
+			continue
+
+	return stats
+
+
+def _pack_sizes(common_dir):
+	try:
+		with os.scandir(Path(common_dir) / 'objects' / 'pack') as entries:
+			return sorted((entry.stat().st_size for entry in entries if entry.name.endswith('.pack')), reverse=True)
+	except OSError:
+		return []
+
+
+async def get_pack_stats(engine, path):
+	"""Pack stats of the repo at path: the count-objects stats plus whether the commit-graph and MIDX exist"""
+	git_dir, common_dir = resolve_git_dirs(path)
+	objects = common_dir / 'objects'
+
+	stats = parse_count_objects(await engine.git('count-objects', '-v', cwd=path, budget='local', repo=path))
+	stats['commit-graph'] = (objects / 'info' / 'commit-graph').exists() or (objects / 'info' / 'commit-graphs').exists()
+	stats['multi-pack-index'] = (objects / 'pack' / 'multi-pack-index').exists()
+	stats['pack-sizes'] = _pack_sizes(common_dir)
+	stats['bare'] = git_dir == Path(path)
+
+	return stats
+
+
+def maintenance_score(stats):
+	"""How badly the repo needs maintenance: loose objects, packs beyond the first, garbage and missing indexes"""
+	score = stats.get('count', 0)
+	score += PACK_WEIGHT * max(stats.get('packs', 0) - 1, 0)
+	score += GARBAGE_WEIGHT * stats.get('garbage', 0)
+
+	if stats.get('packs', 0) and not stats.get('commit-graph'):
+		score += MISSING_INDEX_WEIGHT
+
+	if stats.get('packs', 0) > 1 and not stats.get('multi-pack-index'):
+		score += MISSING_INDEX_WEIGHT
+
+	return score
+
+
+def get_maintenance_steps(stats, threads=1):
+	"""git commands (as arg lists) bringing a repo with stats in shape.
+
+	Loose objects are packed into a new pack without rewriting the existing
+	ones (incremental repack). The packs are indexed by a multi-pack-index,
+	packs it made redundant are expired and small packs are combined in
+	batches below the size of the second largest pack, like the
+	incremental-repack task of 'git maintenance'. pack.threads limits the
+	threads of every command, so the local budget bounds the CPUs used.
+	Bare repos (mirrors) have no working tree to speed up status for.
+	"""
+	config = ['-c', f"pack.threads={threads}"]
+	steps = []
+
+	if stats.get('count', 0):
+		steps.append(config + ['repack', '-d', '-l', '-q', '--no-write-bitmap-index'])
+
+	steps.append(config + ['multi-pack-index', 'write', '--no-progress'])
+
+	sizes = stats.get('pack-sizes') or []
+	if len(sizes) > 1:
+		steps.append(config + ['multi-pack-index', 'expire', '--no-progress'])
+		batch_size = min(sizes[1] + 1, MAX_BATCH_SIZE) if len(sizes) > 2 else 0
+		if batch_size:
+			steps.append(config + ['multi-pack-index', 'repack', f"--batch-size={batch_size}", '--no-progress'])
+
+	steps.append(config + ['commit-graph', 'write', '--reachable', '--split', '--changed-paths', '--no-progress'])
+
+	if stats.get('bare'):
+		return steps
+
+	steps.append(['config', 'core.untrackedCache', 'true'])
+	if sys.platform in FSMONITOR_PLATFORMS:
+		steps.append(['config', 'core.fsmonitor', 'true'])
+
+	return steps
+
+
+async def maintain_repo(engine, path, stats, rate_limit=None, threads=1, dry_run=False):
+	"""Run the maintenance steps on the repo at path, returns the output lines.
+
+	rate_limit is a TokenBucket the repo waits for before starting.
+	"""
+	steps = get_maintenance_steps(stats, threads)
+	output = [" ".join(['git', *step]) for step in steps]
+
+	if dry_run:
+		return output
+
+	if rate_limit is not None:
+		await asyncio.sleep(rate_limit.reserve())
+
+	with timings.phase('maintain', path):
+		for step in steps:
+			await engine.git(*step, cwd=path, budget='local', repo=path)
+
+	return output
+
+
+def get_rate_limit(rate):
+	"""TokenBucket starting at most rate repos per second, None for no limit"""
+	if not rate:
+		return None
+
+	return TokenBucket(rate, 1)
@@ -0,0 +1,89 @@
+#/usr/bin/python3
+
+
+import os, sys
+import json
+import logging
+
+from tabulate import tabulate
+
+from glone.timing import timings
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+JSONL_FORMATS = ['jsonl', 'ndjson']
+
+
+class TableOutput(object):
+	"""Collect records and print them as one table through tabulate on close.
+
+	columns is a list of (key, header) tuples selecting the record fields
+	shown. to_rows can turn one record into several table rows.
+	"""
+	streaming = False
+
+	def __init__(self, columns, tablefmt, title=None, sort_key=None, to_rows=None):
+		self.columns = columns
+		self.tablefmt = tablefmt
+		self.title = title
+		self.sort_key = sort_key
+		self.to_rows = to_rows
+		self.records = []
+
+
+	def write(self, record):
+		self.records.append(record)
+
+
+	def close(self):
+		with timings.phase('render'):
+			self._render()
+
+
+	def _render(self):
+		records = self.records
+		if self.sort_key:
+			records = sorted(records, key=self.sort_key)
+
+		data = [[header for key, header in self.columns]]
+		for record in records:
+			if self.to_rows:
+				data += self.to_rows(record)
+			else:
+				data.append([record[key] for key, header in self.columns])
+
+		if self.title:
+			print(f"# {self.title}")
+			print("")
+
+		print(tabulate(data, headers="firstrow", tablefmt=self.tablefmt))
+		print("\n" if self.title else "")
+
+
+class JsonlOutput(object):
+	"""Print every record as one JSON line as soon as it is written"""
+	streaming = True
+
+	def __init__(self, kind=None):
+		self.kind = kind
+
+
+	def write(self, record):
+		if self.kind:
+			record = {'kind': self.kind, **record}
+
+		print(json.dumps(record, default=str), flush=True)
+
+
+	def close(self):
+		pass
+
+
+def get_output(tablefmt, columns, title=None, kind=None, sort_key=None, to_rows=None):
+	"""Writer for tablefmt, 'jsonl' (or 'ndjson') streams records, anything else is passed to tabulate"""
+	if tablefmt in JSONL_FORMATS:
+		return JsonlOutput(kind)
+
+	return TableOutput(columns, tablefmt, title, sort_key, to_rows)
@@ -0,0 +1,28 @@
+#/usr/bin/python3
+
+
+import os, sys
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+
+def run_parallel(func, items, jobs):
+	"""Run func(item) for every item on a pool of at most jobs threads.
+
+	Yields (item, result, error) tuples in completion order. Errors are
+	caught per item so a single failure does not stop the other workers.
+	"""
+	with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+		futures = {executor.submit(func, item): item for item in items}
+
+		for future in as_completed(futures):
+			item = futures[future]
+			try:
+				yield item, future.result(), None
+			except Exception as e:
+				yield item, None, e
@@ -2,29 +2,55 @@
 
 
 import os, sys
-import re
 import logging
+import threading
+import time
 
 from pathlib import Path
 from copy import deepcopy
+from datetime import datetime, timezone
+from itertools import islice
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import gitlab
 
-from cerberus import Validator
-
-from glone import schema
-from glone.group import GloneGroup
+from glone.cache import project_attributes
+from glone.github import GithubClient, GITHUB_GRAPHQL_URL, OWNERS_PER_QUERY, repository_attributes
+from glone.config import get_defaults
+from glone.timing import timings
+from glone.group import GloneGroup, make_matcher
 from glone.repo import GloneRepo
 
 
 logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
 
+PER_PAGE = 100
+
+# Project attribute holding the clone url of each protocol
+URL_ATTRIBUTES = {
+	'ssh': 'ssh_url_to_repo',
+	'https': 'http_url_to_repo',
+}
+
+# Seconds subtracted from the cache timestamp when asking for changed projects, covers clock skew
+REVALIDATE_MARGIN = 300
+
+
+def _count_response(response, *args, **kwargs):
+	timings.count('api_requests', 1)
+	timings.count('api_bytes', len(response.content))
+
 
 class GloneRemote(object):
-	def __init__(self, auth, remote_config, default_config):
+	def __init__(self, auth, remote_config, default_config, cache=None, session=None):
 		self._auth = auth
+		self._cache = cache
+		self._session = session
+		self._connection = None
+		self._connection_lock = threading.Lock()
 
-		norm_remote = Validator(schema.remote).normalized({})
+		norm_remote = get_defaults('remote')
 		self.__dict__.update(**norm_remote)
 
 		defaults = deepcopy(default_config)
@@ -47,13 +73,43 @@ class GloneRemote(object):
 		if 'name' not in remote_config:
 			self.name = self.id
 
-		self._git = self._connect()
-
 		# setup groups
 		self.groups = [GloneGroup(group, self.defaults) for group in self.groups]
 
 		self.users = [GloneGroup(user, self.defaults) for user in self.users]
 
+		if self.discovery != {} and self.discovery != False:
+			for group in self._discover_groups():
+				group_config = dict(get_defaults('group'))
+				group_config['id']      = group['path']
+				group_config['name']    = group['name']
+				group_config['source']  = group['path']
+				group_config['dest']    = group['name'].replace(' ', '')
+
+				if not any([g.source == group_config['source'] for g in self.groups]):
+					self.groups.append(GloneGroup(group_config, self.defaults))
+					logging.info(f"Add group {group['name']} by discovery")
+
+
+	@property
+	def _git(self):
+		"""Connection to the remote, established on first use"""
+		with self._connection_lock:
+			if self._connection is None:
+				if self._cache and self._cache.offline:
+					logging.error(f"Remote '{self.id}' needs to be contacted but running offline")
+					sys.exit(1)
+
+				with timings.phase('connect'):
+					self._connection = self._connect()
+
+				session = getattr(self._connection, 'session', None)
+				# The session may be shared with other remotes, count each response once
+				if timings.enabled and session is not None and _count_response not in session.hooks['response']:
+					session.hooks['response'].append(_count_response)
+
+		return self._connection
+
 
 	def _connect(self):
 		logging.error("Use of abstract remote not supported")
@@ -62,6 +118,76 @@ class GloneRemote(object):
 		return None
 
 
+	def _discovery_options(self):
+		# 'discovery: true' enables discovery with the default options
+		return self.discovery if isinstance(self.discovery, dict) else {}
+
+
+	def _list_groups(self):
+		"""Top-level groups found by discovery as [{'path', 'name'}]"""
+		return []
+
+
+	def _discover_groups(self):
+		cache_source = f"{self.discovery}"
+		entry = self._cache.load(self.id, 'discovery', cache_source) if self._cache else None
+
+		if self._cache and self._cache.is_fresh(entry):
+			git_groups = entry['items']
+
+		else:
+			with timings.phase('api-discovery'):
+				git_groups = self._list_groups()
+
+			if self._cache:
+				self._cache.store(self.id, 'discovery', cache_source, git_groups)
+
+		matches = make_matcher(excludes=self._discovery_options().get('excludes', []))
+
+		return [g for g in git_groups if matches(g['name'])]
+
+
+	def _make_repo(self, group, project):
+		dest = Path(project['path_with_namespace'])
+
+		if group.dest:
+			dest = Path(group.dest) / Path(*(dest.parts[1:]))
+
+		repo_config = {
+			'id': project['id'],
+			'name': project['name'],
+			'source': project[URL_ATTRIBUTES[group.protocol]],
+			'dest': dest,
+			'last_activity_at': project.get('last_activity_at'),
+		}
+
+		# Forks share the reference repo of the project they were forked from
+		forked_from = project.get('forked_from_project') or {}
+		repo_config['family'] = forked_from.get('path_with_namespace') or project['path_with_namespace']
+
+		repo_config.update(**group.defaults)
+
+		return GloneRepo(repo_config)
+
+
+	def _list_options(self, group):
+		"""Filters of group passed to the API when listing its projects"""
+		return group.filters()
+
+
+	def _cache_source(self, group):
+		"""Cache key of the projects of group, entries listed with other filters are not reused"""
+		options = self._list_options(group)
+		if not options:
+			return group.source
+
+		return f"{group.source}?{urlencode(sorted(options.items()))}"
+
+
+	def _filter_projects(self, group, projects):
+		return [project for project in projects if group.matches(project['name'])]
+
+
 	def get_repo(self, repo):
 		pass
 
@@ -71,26 +197,34 @@ class GloneRemote(object):
 
 
 class GitlabRemote(GloneRemote):
-	def __init__(self, auth, emote_config, default_config):
-		super().__init__(auth, emote_config, default_config)
+	def __init__(self, auth, emote_config, default_config, cache=None, session=None):
+		super().__init__(auth, emote_config, default_config, cache, session)
 
-		if self.discovery != {} and self.discovery != False:
-			git_groups = self._git.groups.list(all=True, owned=self.discovery['owned_only'], starred=self.discovery['starred_only'])
-			git_groups = [g for g in git_groups if g.parent_id is None]
 
-			for pattern in self.discovery['excludes']:
-				git_groups = list(filter(lambda g: not re.match(pattern, g.name), git_groups))
+	def _list_options(self, group):
+		"""Server-side filters of group, plus the 'simple' projection.
 
-			for group in git_groups:
-				group_config = Validator(schema.group).normalized({})
-				group_config['id']      = group.path
-				group_config['name']    = group.name
-				group_config['source']  = group.path
-				group_config['dest']    = group.name.replace(' ', '')
+		The simple projection leaves out the fork parent, it is only used by
+		default if the group's repos do not share reference repos.
+		"""
+		options = group.filters()
 
-				if not any([g.source == group_config['source'] for g in self.groups]):
-					self.groups.append(GloneGroup(group_config, self.defaults))
-					logging.info(f"Add group {group.name} by discovery")
+		simple = group.simple
+		if simple is None:
+			simple = group.defaults.get('clone_strategy') != 'reference'
+
+		if simple:
+			options['simple'] = True
+
+		return options
+
+
+	def _list_groups(self):
+		options = self._discovery_options()
+		git_groups = self._git.groups.list(all=True, top_level_only=True, owned=options.get('owned_only', False), starred=options.get('starred_only', False))
+
+		# Servers older than top_level_only ignore it and list subgroups as well
+		return [{'path': g.path, 'name': g.name} for g in git_groups if g.parent_id is None]
 
 
 	def _connect(self):
@@ -99,20 +233,20 @@ class GitlabRemote(GloneRemote):
 		if self._auth.get('server', None):
 			if self._auth.get('config', None):
 				try:
-					git = gitlab.Gitlab.from_config(self._auth['server'], [self._auth['config']])
+					git = gitlab.Gitlab.from_config(self._auth['server'], [self._auth['config']], session=self._session)
 				except:
 					logging.error(f"Authentication with server '{self._auth['server']}' and config '{self._auth['config']}' failed")
 					sys.exit(1)
 			else:
 				try:
-					git = gitlab.Gitlab.from_config(self._auth['server'])
+					git = gitlab.Gitlab.from_config(self._auth['server'], session=self._session)
 				except:
 					logging.error(f"Authentication with server '{self._auth['server']}' failed")
 					sys.exit(1)
 
 		elif self._auth.get('token', None):
 			try:
-				git = gitlab.Gitlab.from_config(url=self.url, private_token=auth['token'])
+				git = gitlab.Gitlab(url=self.url, private_token=self._auth['token'], session=self._session)
 			except:
 				logging.error(f"Authentication with url '{self.url}' and token ailed")
 				sys.exit(1)
@@ -124,78 +258,247 @@ class GitlabRemote(GloneRemote):
 		return git
 
 
-	def get_repos(self):
-		repos = []
+	def _get_manager(self, kind, group):
+		if kind == 'user':
+			return self._git.users.get(group.source, lazy=True).projects
 
-		for user in self.users:
-			logging.debug(f"Getting group {user.name}")
-			git_user = self._git.users.list(username=user.source)[0]
-			git_repos = git_user.projects.list(all=True)
+		return self._git.groups.get(group.source, lazy=True).projects
 
-			for pattern in user.excludes:
-				git_repos = list(filter(lambda r: not re.match(pattern, r.name), git_repos))
 
-			for repo in git_repos:
-				dest = Path(repo.attributes['path_with_namespace'])
+	def _list_first_page(self, kind, group, entry, **kwargs):
+		"""Fetch the first page of a list call, returns its items and the total page count.
 
-				if user.dest:
-					dest = Path(user.dest) / Path(*(dest.parts[1:]))
+		A stale cache entry is revalidated first, the listing is only
+		requested if that fails.
+		"""
+		manager = self._get_manager(kind, group)
 
-				repo_config = {
-					'id': repo.id,
-					'name': repo.name,
-					'source': repo.attributes[f"{user.protocol}_url_to_repo"],
-					'dest': dest,
-					'clone': user.defaults['clone'],
-					'tasks': user.defaults['tasks']
-				}
-				repo_config.update(**user.defaults)
+		if entry is not None:
+			with timings.phase('api-revalidate'):
+				projects = self._revalidate(manager, entry, **kwargs)
+			if projects is not None:
+				return projects, 1
 
-				repos.append(GloneRepo(repo_config))
+		with timings.phase('api-page'):
+			git_list = manager.list(iterator=True, per_page=PER_PAGE, **kwargs)
+			total_pages = git_list.total_pages
 
-		for group in self.groups:
-			logging.debug(f"Getting group {group.name}")
-			git_group = self._git.groups.get(group.source)
-			git_repos = git_group.projects.list(all=True, include_subgroups=True)
+			if total_pages is None:
+				# GitLab omits the page count for very large lists, fall back to following links
+				return [project_attributes(p) for p in git_list], 1
 
-			for pattern in group.excludes:
-				git_repos = list(filter(lambda r: not re.match(pattern, r.name), git_repos))
+			# The server may cap per_page, only take the items of the first page
+			return [project_attributes(p) for p in islice(git_list, git_list.per_page or PER_PAGE)], total_pages
 
-			for repo in git_repos:
-				dest = Path(repo.attributes['path_with_namespace'])
 
-				if group.dest:
-					dest = Path(group.dest) / Path(*(dest.parts[1:]))
+	def _list_page(self, kind, group, page, **kwargs):
+		manager = self._get_manager(kind, group)
 
-				repo_config = {
-					'id': repo.id,
-					'name': repo.name,
-					'source': repo.attributes[f"{group.protocol}_url_to_repo"],
-					'dest': dest,
-					'clone': group.defaults['clone'],
-					'tasks': group.defaults['tasks']
-				}
-				repo_config.update(**group.defaults)
+		with timings.phase('api-page'):
+			return [project_attributes(p) for p in manager.list(page=page, per_page=PER_PAGE, get_all=False, **kwargs)]
 
-				repos.append(GloneRepo(repo_config))
 
-		return repos
+	def _revalidate(self, manager, entry, **kwargs):
+		"""Merge the projects updated since entry was stored into it.
+
+		Returns None if the merged list does not match the number of projects
+		on the server (e.g. because projects were deleted).
+		"""
+		since = datetime.fromtimestamp(entry['timestamp'] - REVALIDATE_MARGIN, timezone.utc).isoformat()
+
+		total = manager.list(iterator=True, per_page=1, **kwargs).total
+		changed = manager.list(get_all=True, per_page=PER_PAGE, updated_after=since, **kwargs)
+
+		projects = {p['id']: p for p in entry['items']}
+		projects.update({p.id: project_attributes(p) for p in changed})
+
+		if total is None or len(projects) != total:
+			return None
+
+		return list(projects.values())
+
+
+	def get_repos(self):
+		"""Discover the projects of all users and groups.
+
+		Users and groups with a fresh cache entry are served from the cache.
+		For the others the first page is requested concurrently and the
+		remaining pages are queued as soon as the page count is known. Repos
+		are yielded while discovery is still running.
+		"""
+		sources = [('user', user, self._list_options(user)) for user in self.users]
+		sources += [('group', group, {'include_subgroups': True, **self._list_options(group)}) for group in self.groups]
+
+		with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+			pending = {}
+			fetched = {}
+
+			for kind, group, kwargs in sources:
+				logging.debug(f"Getting {kind} {group.name}")
+				entry = self._cache.load(self.id, kind, self._cache_source(group)) if self._cache else None
+
+				if self._cache and self._cache.is_fresh(entry):
+					for project in self._filter_projects(group, entry['items']):
+						yield self._make_repo(group, project)
+					continue
+
+				future = executor.submit(self._list_first_page, kind, group, entry, **kwargs)
+				pending[future] = (kind, group, kwargs, None)
+				fetched[(kind, group.source)] = {'items': [], 'pages': 1, 'timestamp': time.time()}
+
+			while pending:
+				done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+				for future in done:
+					kind, group, kwargs, page = pending.pop(future)
+					state = fetched[(kind, group.source)]
+
+					if page is None:
+						projects, total_pages = future.result()
+						state['pages'] += total_pages - 1
+						for page in range(2, total_pages + 1):
+							page_future = executor.submit(self._list_page, kind, group, page, **kwargs)
+							pending[page_future] = (kind, group, kwargs, page)
+					else:
+						projects = future.result()
+
+					state['items'] += projects
+					state['pages'] -= 1
+					if state['pages'] == 0 and self._cache:
+						self._cache.store(self.id, kind, self._cache_source(group), state['items'], state['timestamp'])
+
+					for project in self._filter_projects(group, projects):
+						yield self._make_repo(group, project)
 
 
 class GithubRemote(GloneRemote):
-	def __init__(self, auth, emote_config, default_config):
-		super().__init__(auth, emote_config, default_config)
+	"""GitHub remote, repos are listed through the GraphQL API.
+
+	Groups are organizations and users are user accounts, both by login.
+	The first page of up to OWNERS_PER_QUERY owners is requested with a
+	single query, owners with more repositories are paged concurrently.
+	The url of the remote is the GraphQL endpoint, it defaults to
+	github.com's. The archived and visibility filters are applied by the
+	API, search (matching the name and the owner/name path) and
+	last_activity_after on the client, min_access_level
+	has no GitHub equivalent and is ignored.
+	"""
+	def __init__(self, auth, emote_config, default_config, cache=None, session=None):
+		super().__init__(auth, emote_config, default_config, cache, session)
 
 
 	def _connect(self):
-		logging.error("GitHub remotes are not yet supported")
-		sys.exit(1)
+		token = self._auth.get('token', None) or os.environ.get('GITHUB_TOKEN')
 
-		return None
+		if not token:
+			logging.error(f"No token for GitHub remote '{self.id}' (set it in auth or GITHUB_TOKEN)")
+			sys.exit(1)
 
+		return GithubClient(getattr(self, 'url', None) or GITHUB_GRAPHQL_URL, token, self._session)
 
-	def get_repos(self):
-		logging.error("GitHub remotes are not yet supported")
-		sys.exit(1)
 
-		return None
+	def _list_groups(self):
+		return self._git.organizations()
+
+
+	def _filter_projects(self, group, projects):
+		"""Apply the filters GraphQL does not support (search, last_activity_after) on the client"""
+		projects = super()._filter_projects(group, projects)
+
+		if group.search:
+			search = group.search.lower()
+			# Like GitLab's search, which matches the name and the path
+			projects = [p for p in projects if search in f"{p['name']} {p['path_with_namespace']}".lower()]
+
+		if group.last_activity_after:
+			projects = [p for p in projects if (p['last_activity_at'] or '') >= group.last_activity_after]
+
+		return projects
+
+
+	def _list_first_pages(self, owners):
+		with timings.phase('api-page'):
+			return self._git.repositories([(group.source, None, group.filters()) for kind, group in owners])
+
+
+	def _list_remaining_pages(self, group, cursor):
+		projects = []
+
+		while cursor:
+			with timings.phase('api-page'):
+				connection = self._git.repositories([(group.source, cursor, group.filters())])[0]
+
+			if connection is None:
+				break
+
+			projects += [repository_attributes(node) for node in connection['nodes']]
+			cursor = connection['pageInfo']['endCursor'] if connection['pageInfo']['hasNextPage'] else None
+
+		return projects
+
+
+	def get_repos(self):
+		"""Discover the repositories of all users and organizations.
+
+		Owners with a fresh cache entry are served from the cache. Repos are
+		yielded while discovery is still running.
+		"""
+		owners = []
+
+		for kind, group in [('user', user) for user in self.users] + [('group', group) for group in self.groups]:
+			logging.debug(f"Getting {kind} {group.name}")
+			entry = self._cache.load(self.id, kind, self._cache_source(group)) if self._cache else None
+
+			if self._cache and self._cache.is_fresh(entry):
+				for project in self._filter_projects(group, entry['items']):
+					yield self._make_repo(group, project)
+				continue
+
+			owners.append((kind, group))
+
+		with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+			pending = {}
+			fetched = {}
+
+			for i in range(0, len(owners), OWNERS_PER_QUERY):
+				batch = owners[i:i + OWNERS_PER_QUERY]
+				pending[executor.submit(self._list_first_pages, batch)] = (batch, None)
+
+			while pending:
+				done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+				for future in done:
+					batch, owner = pending.pop(future)
+
+					if owner is None:
+						results = []
+						for (kind, group), connection in zip(batch, future.result()):
+							if connection is None:
+								# Owner not found, remembered as empty so --offline runs know about it
+								if self._cache:
+									self._cache.store(self.id, kind, self._cache_source(group), [])
+								continue
+
+							projects = [repository_attributes(node) for node in connection['nodes']]
+							fetched[(kind, group.source)] = {'items': projects, 'timestamp': time.time()}
+
+							if connection['pageInfo']['hasNextPage']:
+								page_future = executor.submit(self._list_remaining_pages, group, connection['pageInfo']['endCursor'])
+								pending[page_future] = (None, (kind, group))
+							elif self._cache:
+								self._cache.store(self.id, kind, self._cache_source(group), projects, fetched[(kind, group.source)]['timestamp'])
+
+							results.append((group, projects))
+					else:
+						kind, group = owner
+						projects = future.result()
+						state = fetched[(kind, group.source)]
+						state['items'] += projects
+						if self._cache:
+							self._cache.store(self.id, kind, self._cache_source(group), state['items'], state['timestamp'])
+
+						results = [(group, projects)]
+
+					for group, projects in results:
+						for project in self._filter_projects(group, projects):
+							yield self._make_repo(group, project)
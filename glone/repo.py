@@ -5,29 +5,102 @@ import os, sys
 import re
 import logging
 
-from cerberus import Validator
-
 from glone import schema
+from glone.config import get_defaults
 
 
 
 logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
 
 
+def normalize_url(url):
+	"""Normalize a git url to 'host/path' so the ssh and https urls of a repo compare equal.
+
+	Handles 'scheme://[user@]host[:port]/path', scp-like 'user@host:path' and
+	local paths, the host is lowercased and a trailing '.git' or '/' dropped.
+	"""
+	url = str(url).strip()
+
+	if url.startswith('file://'):
+		host, path = '', url[len('file://'):]
+	else:
+		match = re.match(r'^[\w+.-]+://(?:[^@/]+@)?([^/:]+)(?::\d*)?(/.*)?$', url)
+		if not match:
+			match = re.match(r'^(?:[^@/]+@)?([^/:]{2,}):(.*)$', url)
+
+		if match:
+			host, path = match.group(1).lower(), match.group(2) or ''
+		else:
+			host, path = '', url
+
+	path = path.rstrip('/')
+	if path.endswith('.git'):
+		path = path[:-len('.git')]
+
+	if host:
+		return f"{host}/{path.strip('/')}"
+
+	return os.path.normpath(path)
+
+
+# Fields whose values repeat across many repos, equal values are stored once
+SHARED_FIELDS = {'tasks', 'sparse', 'clone_strategy', 'filter', 'family'}
+
+_shared = {}
+
+
+def _share(value):
+	if isinstance(value, list):
+		value = tuple(value)
+
+	if isinstance(value, str):
+		return sys.intern(value)
+
+	if isinstance(value, tuple):
+		try:
+			return _shared.setdefault(value, value)
+		except TypeError:
+			# Lists of task dicts are not hashable
+			return value
+
+	return value
+
+
 class GloneRepo(object):
-	def __init__(self, repo_config):
-		norm_repo = Validator(schema.repo).normalized({})
-		self.__dict__.update(**norm_repo)
+	"""Repo record with the fields of the repo schema.
 
-		for key, value in norm_repo.items():
-			if key in repo_config and repo_config[key] != value:
-				del repo_config[key]
+	Fields are stored in slots, defaults and equal task lists are shared
+	between repos instead of being copied into each one. List fields
+	(tasks, sparse) are stored as tuples. The dest defaults to the id,
+	like for groups.
+	"""
+	__slots__ = tuple(schema.repo) + ('last_activity_at',)
 
-		self.__dict__.update(**repo_config)
+	def __init__(self, repo_config):
+		defaults = get_defaults('repo')
+
+		for key in self.__slots__:
+			value = repo_config[key] if key in repo_config else defaults.get(key)
+			if key in SHARED_FIELDS:
+				value = _share(value)
+			elif isinstance(value, list):
+				value = tuple(value)
+			setattr(self, key, value)
 
-		if 'name' not in repo_config:
+		if self.name is None:
 			self.name = self.id
 
+		if self.dest is None:
+			self.dest = self.id
+
+		for key in repo_config:
+			if key not in self.__slots__:
+				raise AttributeError(f"Unknown repo attribute '{key}'")
+
+
+	def to_dict(self):
+		return {key: getattr(self, key) for key in self.__slots__}
+
 
 	def __str__(self):
-		return f"{self.__dict__}"
+		return f"{self.to_dict()}"
@@ -0,0 +1,187 @@
+#/usr/bin/python3
+
+
+import os, sys
+import json
+import logging
+
+from pathlib import Path
+
+from glone.pool import run_parallel
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+# Directory under the prefix holding glone's own state, never scanned for repos
+STATE_DIR = '.glone'
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 2
+
+BARE_ENTRIES = {'objects', 'refs'}
+
+
+def get_repo_path(git_dir):
+	"""Path of the repo owning git_dir: its working tree, or the repo itself if it is bare"""
+	git_dir = Path(git_dir)
+	return git_dir.parent if git_dir.name == '.git' else git_dir
+
+
+def is_bare(git_dir):
+	return Path(git_dir).name != '.git'
+
+
+def load_json(path, version=None):
+	"""Object stored in the JSON file at path, None if it is missing, unreadable or of another version"""
+	try:
+		with open(path) as file:
+			data = json.load(file)
+	except (OSError, ValueError):
+		return None
+
+	if not isinstance(data, dict) or (version is not None and data.get('version') != version):
+		return None
+
+	return data
+
+
+def store_json(path, data, version=None, private=False):
+	"""Atomically replace the JSON file at path by data, tagged with version if given.
+
+	Private files are only readable by the user, as is their directory.
+	Raises TypeError or ValueError, before touching the file, if data can
+	not be stored as JSON.
+	"""
+	path = Path(path)
+	text = json.dumps(data if version is None else {'version': version, **data})
+
+	if private:
+		path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+		os.chmod(path.parent, 0o700)
+	else:
+		path.parent.mkdir(parents=True, exist_ok=True)
+
+	tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+	with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 if private else 0o666), 'w') as file:
+		file.write(text)
+	os.replace(tmp_path, path)
+
+
+class LocalScanner(object):
+	"""Find the git repos below a prefix.
+
+	A directory containing a '.git' directory or file (worktrees,
+	submodules) is a repo root, the scanner does not descend into it. The
+	top-level directories are scanned in parallel. Bare repos (e.g. the
+	mirrors of 'update --mirror') are reported with the repo directory as
+	their git dir and not descended into either.
+
+	Every visited directory is stored in an index together with its mtime.
+	A directory whose mtime did not change since the last scan has the same
+	entries, so its child directories are taken from the index instead of
+	listing it again.
+	"""
+	def __init__(self, prefix, jobs=1):
+		self.prefix = Path(prefix)
+		self.jobs = jobs
+		self.index_path = self.prefix / STATE_DIR / INDEX_FILE
+
+
+	def _load_index(self):
+		index = load_json(self.index_path, INDEX_VERSION)
+		return index['dirs'] if index else {}
+
+
+	def _store_index(self, dirs):
+		store_json(self.index_path, {'dirs': dirs}, INDEX_VERSION)
+
+
+	def _read_dir(self, path):
+		"""List a directory, returns (git entry name or None, child directory names).
+
+		The git entry of a bare repo is '.', the directory itself.
+		"""
+		dirs = []
+
+		try:
+			with os.scandir(path) as entries:
+				for entry in entries:
+					if entry.name == '.git':
+						return entry.name, []
+
+					if entry.is_dir(follow_symlinks=False) and entry.name != STATE_DIR:
+						dirs.append(entry.name)
+		except OSError as e:
+			logging.debug(f"Unable to scan {path}: {e}")
+
+		if BARE_ENTRIES.issubset(dirs) and os.path.isfile(os.path.join(path, 'HEAD')):
+			return '.', []
+
+		return None, dirs
+
+
+	def _entry(self, path, old_index):
+		"""Index entry of path, the directory is only listed if its mtime changed"""
+		try:
+			mtime = os.stat(path).st_mtime_ns
+		except OSError:
+			return None
+
+		entry = old_index.get(path)
+		if entry is None or entry['mtime'] != mtime:
+			git, dirs = self._read_dir(path)
+			entry = {'mtime': mtime, 'git': git, 'dirs': dirs}
+
+		return entry
+
+
+	def _scan(self, path, old_index):
+		"""Scan the tree below path, returns the found repos and the index entries"""
+		repos = []
+		index = {}
+		stack = [path]
+
+		while stack:
+			current = stack.pop()
+
+			entry = self._entry(current, old_index)
+			if entry is None:
+				continue
+
+			index[current] = entry
+
+			if entry['git']:
+				repos.append(os.path.normpath(os.path.join(current, entry['git'])))
+			else:
+				stack += [os.path.join(current, name) for name in entry['dirs']]
+
+		return repos, index
+
+
+	def scan(self):
+		"""Returns the sorted git dirs of all repos below the prefix ('.git' entries and bare repos)"""
+		old_index = self._load_index()
+		root = str(self.prefix)
+
+		entry = self._entry(root, old_index)
+		if entry is None:
+			return []
+
+		if entry['git']:
+			return [os.path.normpath(os.path.join(root, entry['git']))]
+
+		repos = []
+		index = {root: entry}
+		top_dirs = [os.path.join(root, name) for name in entry['dirs']]
+
+		for path, result, error in run_parallel(lambda p: self._scan(p, old_index), top_dirs, self.jobs):
+			if error:
+				logging.warning(f"Unable to scan {path}: {error}")
+				continue
+
+			repos += result[0]
+			index.update(result[1])
+
+		self._store_index(index)
+
+		return sorted(repos)
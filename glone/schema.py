@@ -22,10 +22,43 @@ class GitProtocol(Enum):
 		return [member.value for member in cls]
 
 
+class CloneStrategy(Enum):
+	FULL = 'full'
+	REFERENCE = 'reference'
+
+	@classmethod
+	def values(cls):
+		return [member.value for member in cls]
+
+
+class Visibility(Enum):
+	PRIVATE = 'private'
+	INTERNAL = 'internal'
+	PUBLIC = 'public'
+
+	@classmethod
+	def values(cls):
+		return [member.value for member in cls]
+
+
+# GitLab access levels: guest, reporter, developer, maintainer, owner
+ACCESS_LEVELS = [10, 20, 30, 40, 50]
+
+
+class CloneFilter(Enum):
+	BLOBLESS = 'blob:none'
+	TREELESS = 'tree:0'
+
+	@classmethod
+	def values(cls):
+		return [member.value for member in cls]
+
+
 # Schema definition
 __remote_defaults = {
 	'auth':      {'type': 'string',  'required': False},
 	'type':      {'type': 'string',  'required': False, 'allowed': RemoteType.values()},
+	'concurrency': {'type': 'integer', 'required': False, 'min': 1},
 	'discovery': {
 		'oneof': [
 			{'type': 'dict'},
@@ -42,12 +75,37 @@ __remote_defaults = {
 
 __groups_defaults = {
 	'excludes':  {'type': 'list',   'required': False, 'schema': {'type': 'string'}},
+	'includes':  {'type': 'list',   'required': False, 'schema': {'type': 'string'}},
 	'protocol':  {'type': 'string', 'required': False, 'allowed': GitProtocol.values()},
+	'archived':            {'type': 'boolean', 'required': False, 'nullable': True},
+	'visibility':          {'type': 'string',  'required': False, 'nullable': True, 'allowed': Visibility.values()},
+	'search':              {'type': 'string',  'required': False, 'nullable': True},
+	'last_activity_after': {'type': 'string',  'required': False, 'nullable': True},
+	'min_access_level':    {'type': 'integer', 'required': False, 'nullable': True, 'allowed': ACCESS_LEVELS},
+	'simple':              {'type': 'boolean', 'required': False, 'nullable': True},
 }
 
+# A task is a git command ("fetch --prune") or a named node of the task graph
+__task_schema = {
+	'name':    {'type': 'string',  'required': True, 'regex': r'[^:\s]+'},
+	'git':     {'type': 'string',  'required': True, 'excludes': 'run'},
+	'run':     {'type': 'string',  'required': True, 'excludes': 'git'},
+	'needs':   {'type': 'list',    'required': False, 'schema': {'type': 'string'}},
+	'timeout': {'type': 'number',  'required': False, 'min': 0},
+	'cache':   {'type': 'boolean', 'required': False},
+}
+
+__tasks_schema = {'anyof': [{'type': 'string'}, {'type': 'dict', 'schema': __task_schema}]}
+
 __repos_defaults = {
-	'clone':     {'type': 'boolean', 'required': False},
-	'tasks':     {'type': 'list',    'required': False, 'schema': {'type': 'string'}},
+	'clone':          {'type': 'boolean', 'required': False},
+	'tasks':          {'type': 'list',    'required': False, 'schema': __tasks_schema},
+	'clone_strategy': {'type': 'string',  'required': False, 'allowed': CloneStrategy.values()},
+	'dissociate':     {'type': 'boolean', 'required': False},
+	'depth':          {'type': 'integer', 'required': False, 'min': 1},
+	'filter':         {'type': 'string',  'required': False, 'allowed': CloneFilter.values()},
+	'single_branch':  {'type': 'boolean', 'required': False},
+	'sparse':         {'type': 'list',    'required': False, 'schema': {'type': 'string'}},
 }
 
 __auth_schema = {
@@ -66,6 +124,13 @@ group = {
 	'dest':     {'type': 'string', 'required': False},
 	'protocol': {'type': 'string', 'required': False, 'allowed': GitProtocol.values(), 'default': 'ssh'},
 	'excludes': {'type': 'list',   'required': False, 'schema': {'type': 'string'}, 'default': []},
+	'includes': {'type': 'list',   'required': False, 'schema': {'type': 'string'}, 'default': []},
+	'archived':            {'type': 'boolean', 'required': False, 'nullable': True, 'default': None},
+	'visibility':          {'type': 'string',  'required': False, 'nullable': True, 'allowed': Visibility.values(), 'default': None},
+	'search':              {'type': 'string',  'required': False, 'nullable': True, 'default': None},
+	'last_activity_after': {'type': 'string',  'required': False, 'nullable': True, 'default': None},
+	'min_access_level':    {'type': 'integer', 'required': False, 'nullable': True, 'allowed': ACCESS_LEVELS, 'default': None},
+	'simple':              {'type': 'boolean', 'required': False, 'nullable': True, 'default': None},
 	'defaults': {
 		'type': 'dict',
 		'required': False,
@@ -80,6 +145,7 @@ remote = {
 	'url':       {'type': 'string',  'required': False},
 	'auth':      {'type': 'string',  'required': False},
 	'type':      {'type': 'string',  'required': True, 'allowed': RemoteType.values()},
+	'concurrency': {'type': 'integer', 'required': False, 'min': 1, 'default': 4},
 	'discovery': {
 		'oneof': [
 			{'type': 'dict'},
@@ -138,12 +204,62 @@ repo = {
 	'source':  {'type': 'string',  'required': True},
 	'dest':    {'type': 'string',  'required': False},
 	'clone':   {'type': 'boolean', 'required': False, 'default': True},
-	'tasks':   {'type': 'list',    'required': False, 'schema': {'type': 'string'}, 'default': ["fetch"]},
+	'tasks':   {'type': 'list',    'required': False, 'schema': __tasks_schema, 'default': ["fetch"]},
+	'family':  {'type': 'string',  'required': False},
+	'clone_strategy': {'type': 'string', 'required': False, 'allowed': CloneStrategy.values(), 'default': 'full'},
+	'dissociate':     {'type': 'boolean', 'required': False, 'default': False},
+	'depth':          {'type': 'integer', 'required': False, 'min': 1},
+	'filter':         {'type': 'string',  'required': False, 'allowed': CloneFilter.values()},
+	'single_branch':  {'type': 'boolean', 'required': False, 'default': False},
+	'sparse':         {'type': 'list',    'required': False, 'schema': {'type': 'string'}, 'default': []},
+}
+
+
+__cache_schema = {
+	'path':    {'type': 'string',  'required': False},
+	'ttl':     {'type': 'integer', 'required': False, 'min': 0, 'default': 3600},
+}
+
+
+__host_limits_schema = {
+	'rate':    {'type': 'number',  'required': False, 'min': 0},
+	'burst':   {'type': 'integer', 'required': False, 'min': 1},
+}
+
+__limits_schema = {
+	'rate':          {'type': 'number',  'required': False, 'min': 0, 'default': 10},
+	'burst':         {'type': 'integer', 'required': False, 'min': 1, 'default': 20},
+	'retries':       {'type': 'integer', 'required': False, 'min': 0, 'default': 3},
+	'backoff':       {'type': 'number',  'required': False, 'min': 0, 'default': 1},
+	'max_backoff':   {'type': 'number',  'required': False, 'min': 0, 'default': 60},
+	'ssh_multiplex': {'type': 'boolean', 'required': False, 'default': True},
+	'ssh_persist':   {'type': 'integer', 'required': False, 'min': 0, 'default': 60},
+	'hosts': {
+		'type': 'dict',
+		'required': False,
+		'keysrules': {'type': 'string'},
+		'valuesrules': {'type': 'dict', 'schema': __host_limits_schema},
+		'default': {}
+	},
 }
 
 
 # This is the complete schema
 config = {
+	'cache': {
+		'type': 'dict',
+		'required': False,
+		'schema': __cache_schema,
+		'default': {}
+	},
+
+	'limits': {
+		'type': 'dict',
+		'required': False,
+		'schema': __limits_schema,
+		'default': {}
+	},
+
 	'defaults': {
 		'type': 'dict',
 		'required': False,
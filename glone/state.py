@@ -0,0 +1,112 @@
+#/usr/bin/python3
+
+
+import os, sys
+import time
+import hashlib
+import logging
+import threading
+
+from pathlib import Path
+
+from datetime import datetime
+
+from glone.repo import normalize_url
+from glone.limits import get_host
+from glone.scanner import STATE_DIR, load_json, store_json
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+SYNC_FILE = 'sync.json'
+SYNC_VERSION = 1
+
+# GitLab updates last_activity_at of a project at most once per hour
+ACTIVITY_GRANULARITY = 3600
+
+SKIP_MODES = ['activity', 'refs']
+
+
+async def remote_refs_hash(engine, source):
+	"""Hash of the refs advertised by the remote ('git ls-remote'), no objects are transferred"""
+	return hashlib.sha1((await engine.git('ls-remote', source, host=get_host(source))).encode()).hexdigest()
+
+
+def _timestamp(value):
+	try:
+		return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+	except (AttributeError, ValueError):
+		return None
+
+
+class SyncState(object):
+	"""Remote state seen by the last successful sync of every repo.
+
+	Entries are keyed by the normalized source url of a repo and stored in
+	<prefix>/.glone/sync.json. Workers update entries concurrently, the
+	file is written once with store().
+	"""
+	def __init__(self, prefix):
+		self.path = Path(prefix) / STATE_DIR / SYNC_FILE
+		self._lock = threading.Lock()
+		self.entries = self._load()
+
+
+	def _load(self):
+		data = load_json(self.path, SYNC_VERSION)
+		return data['repos'] if data else {}
+
+
+	def get(self, key):
+		with self._lock:
+			return dict(self.entries.get(key, {}))
+
+
+	def set(self, key, **values):
+		with self._lock:
+			self.entries.setdefault(key, {}).update(values)
+
+
+	def store(self):
+		with self._lock:
+			store_json(self.path, {'repos': self.entries}, SYNC_VERSION)
+
+
+	async def check(self, engine, repo, mode):
+		"""Compare the remote state of repo with the last successful sync.
+
+		Returns (unchanged, current), current is the state to record once
+		the repo was synced. In 'activity' mode the last_activity_at
+		reported by the remote is compared; as GitLab only updates it hourly
+		an equal value is only trusted if the last sync happened at least
+		an hour after it, otherwise (and in 'refs' mode) the hash of the
+		refs advertised by the remote is compared.
+		"""
+		last = self.get(normalize_url(repo.source))
+		current = {'synced_at': time.time()}
+
+		activity = getattr(repo, 'last_activity_at', None)
+		if activity:
+			current['last_activity_at'] = activity
+
+		if mode is None:
+			return False, current
+
+		if mode == 'activity' and activity:
+			if last.get('last_activity_at') != activity:
+				return False, current
+
+			activity_time = _timestamp(activity)
+			if activity_time and last.get('synced_at', 0) - activity_time >= ACTIVITY_GRANULARITY:
+				return True, current
+
+		current['refs'] = await remote_refs_hash(engine, repo.source)
+
+		return last.get('refs') == current['refs'], current
+
+
+	def record(self, repo, current):
+		"""Replace the entry of repo with the state taken by check()"""
+		with self._lock:
+			self.entries[normalize_url(repo.source)] = current
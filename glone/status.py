@@ -0,0 +1,159 @@
+#/usr/bin/python3
+
+
+import os, sys
+import time
+import logging
+
+from pathlib import Path
+
+from glone.backend import resolve_git_dirs
+from glone.scanner import STATE_DIR, get_repo_path, load_json, store_json
+from glone.timing import timings
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+STATUS_FILE = 'status.json'
+STATUS_VERSION = 3
+
+# Fingerprinting pays off if it costs less than this share of collecting the status
+FINGERPRINT_MAX_COST = 0.5
+
+# Repos collected without fingerprint measure it again every this many runs
+FINGERPRINT_RECHECK = 10
+
+def format_branch(is_head, name, upstream, divergence):
+	pref = '*' if is_head else "-"
+
+	if not upstream:
+		return f"{pref} {name} []"
+
+	if divergence is None:
+		return f"{pref} {name} [{upstream} gone]"
+
+	return f"{pref} {name} [{upstream} v{divergence[0]} / ^{divergence[1]}]"
+
+
+def _mtime(path):
+	try:
+		return os.stat(path).st_mtime_ns
+	except OSError:
+		return 0
+
+
+def _tree_mtime(path, skip=()):
+	"""Newest mtime of path and everything below it, nested repos are not descended"""
+	newest = _mtime(path)
+	stack = [path]
+
+	while stack:
+		current = stack.pop()
+		try:
+			with os.scandir(current) as entries:
+				for entry in entries:
+					if entry.name in skip:
+						continue
+
+					try:
+						newest = max(newest, entry.stat(follow_symlinks=False).st_mtime_ns)
+					except OSError:
+						continue
+
+					if entry.is_dir(follow_symlinks=False) and not os.path.lexists(os.path.join(entry.path, '.git')):
+						stack.append(entry.path)
+		except OSError:
+			continue
+
+	return newest
+
+
+def get_fingerprint(path):
+	"""Fingerprint of everything 'git status' and the branch divergence depend on.
+
+	Covers the mtimes of the index, HEAD, config, packed-refs and of every
+	directory below refs (loose refs are updated by renaming a lock file,
+	which changes the directory mtime), plus the newest mtime in the
+	working tree.
+	"""
+	git_dir, common_dir = resolve_git_dirs(path)
+
+	fingerprint = [
+		_mtime(git_dir / 'index'),
+		_mtime(git_dir / 'HEAD'),
+		_mtime(common_dir / 'config'),
+		_mtime(common_dir / 'packed-refs'),
+	]
+
+	for root, dirs, files in os.walk(common_dir / 'refs'):
+		fingerprint.append(_mtime(root))
+
+	fingerprint.append(_tree_mtime(path, skip=('.git',)))
+
+	return fingerprint
+
+
+class StatusCache(object):
+	"""Status results of the last 'diff --git' run, keyed by git dir.
+
+	A stored result is reused as long as the fingerprint of the repo is
+	unchanged. The fingerprint is taken before running git, so changes made
+	while the status is collected invalidate the entry on the next run.
+
+	The fingerprint stats the whole working tree in Python, in repos with
+	many files that costs more than 'git status' itself. The time both took
+	is kept per repo, repos where the fingerprint does not cost less than
+	FINGERPRINT_MAX_COST of the status skip it and always run git.
+	"""
+	def __init__(self, prefix, backend, force=False):
+		self.path = Path(prefix) / STATE_DIR / STATUS_FILE
+		self.backend = backend
+		self.force = force
+		self.entries = self._load()
+
+
+	def _load(self):
+		if self.force:
+			return {}
+
+		data = load_json(self.path, STATUS_VERSION)
+		return data['repos'] if data else {}
+
+
+	def store(self, git_dirs):
+		"""Persist the entries of git_dirs, entries of repos no longer found are dropped"""
+		self.entries = {git_dir: self.entries[git_dir] for git_dir in git_dirs if git_dir in self.entries}
+		store_json(self.path, {'repos': self.entries}, STATUS_VERSION)
+
+
+	def get_status(self, git_dir):
+		"""Status of the repo owning git_dir, reused from the last run if nothing changed"""
+		path = get_repo_path(git_dir)
+		entry = self.entries.get(git_dir)
+		fingerprint = None
+
+		fingerprint_cost, status_cost, skipped = entry['costs'] if entry else (0.0, 0.0, 0)
+		use_fingerprint = fingerprint_cost < FINGERPRINT_MAX_COST * status_cost or skipped >= FINGERPRINT_RECHECK or not entry
+
+		if use_fingerprint:
+			start = time.perf_counter()
+			with timings.phase('fingerprint', path):
+				fingerprint = get_fingerprint(path)
+			fingerprint_cost = time.perf_counter() - start
+			skipped = 0
+
+			if entry and entry['fingerprint'] == fingerprint:
+				entry['costs'] = [fingerprint_cost, status_cost, skipped]
+				return entry['status']
+		else:
+			skipped += 1
+
+		start = time.perf_counter()
+		with timings.phase('status', path):
+			status = self.backend.status(path), self.backend.branches(path)
+		status_cost = time.perf_counter() - start
+
+		self.entries[git_dir] = {'fingerprint': fingerprint, 'status': status, 'costs': [fingerprint_cost, status_cost, skipped]}
+
+		return status
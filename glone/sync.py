@@ -0,0 +1,219 @@
+#/usr/bin/python3
+
+
+import os, sys
+import re
+import logging
+import asyncio
+
+from pathlib import Path
+
+from glone.limits import get_host
+from glone.repo import normalize_url
+from glone.tasks import TaskGraph, run_tasks
+from glone.timing import timings
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+
+class SyncError(Exception):
+	"""Raised by update_repo, carries the output collected before the failure"""
+	def __init__(self, error, output):
+		super().__init__(str(error))
+		self.error = error
+		self.output = output
+
+
+_family_locks = {}
+
+
+def _family_lock(family):
+	# Only used from the event loop thread, no lock needed around the dict
+	return _family_locks.setdefault(family, asyncio.Lock())
+
+
+def _safe_name(name):
+	return re.sub(r'[^A-Za-z0-9._-]', '_', str(name))
+
+
+def get_family(repo):
+	"""Family of repo, repos of a family share one reference repo.
+
+	Remotes set it to the project a fork was forked from, otherwise the
+	path of the source url (without host) is used.
+	"""
+	family = getattr(repo, 'family', None)
+
+	if not family:
+		family = normalize_url(repo.source).split('/', 1)[-1]
+
+	return family
+
+
+def get_clone_options(repo):
+	"""Clone options of the repo's clone profile (depth, filter, single branch, sparse)"""
+	options = {}
+
+	if getattr(repo, 'depth', None):
+		options['depth'] = repo.depth
+
+	if getattr(repo, 'filter', None):
+		options['filter'] = repo.filter
+
+	if getattr(repo, 'single_branch', False):
+		options['single_branch'] = True
+
+	if getattr(repo, 'sparse', None):
+		options['sparse'] = True
+
+	return options
+
+
+def _clone_flags(options):
+	return [f"--{key.replace('_', '-')}" if value is True else f"--{key.replace('_', '-')}={value}" for key, value in options.items()]
+
+
+async def update_reference(engine, repo, reference_dir, dry_run=False):
+	"""Fetch the objects of repo into the bare reference repo of its family.
+
+	The refs of every member are kept below refs/glone/<repo id>/ so the
+	objects the clones borrow through their alternates stay reachable.
+	Returns the path of the reference repo and the output lines.
+	"""
+	family = get_family(repo)
+	reference = Path(reference_dir) / f"{_safe_name(family)}.git"
+	namespace = f"refs/glone/{_safe_name(repo.id)}"
+	output = [f"git -C {reference} fetch {repo.source} (family {family})"]
+
+	if dry_run:
+		return reference, output
+
+	async with _family_lock(family):
+		if not reference.exists():
+			await engine.git('init', '--bare', '--quiet', str(reference), repo=repo.dest)
+
+		with timings.phase('reference', repo.dest):
+			await engine.git(
+				'-C', str(reference), 'fetch',
+				'--no-tags',
+				repo.source,
+				f"+refs/heads/*:{namespace}/heads/*",
+				f"+refs/tags/*:{namespace}/tags/*",
+				budget='network', repo=repo.dest, host=get_host(repo.source)
+			)
+
+	return reference, output
+
+
+def _objects_size(repo_path):
+	"""Size of the object store, used to estimate the bytes transferred by clone and fetch"""
+	total = 0
+
+	for root, dirs, files in os.walk(Path(repo_path) / '.git' / 'objects'):
+		for name in files:
+			try:
+				total += os.path.getsize(os.path.join(root, name))
+			except OSError:
+				pass
+
+	return total
+
+
+async def update_repo(engine, repo, repo_path, dry_run=False, reference_dir=None, done=(), on_step=None, graph=None, task_cache=None):
+	"""Clone repo into repo_path if missing and run its tasks.
+
+	With the 'reference' clone strategy the objects are fetched into the
+	reference repo of the repo's family below reference_dir first and the
+	clone borrows them from there (optionally dissociating afterwards).
+
+	Tasks run as nodes of graph, which the caller added repo to, so they
+	can wait for tasks of other repos. Without a graph only dependencies
+	within the repo are possible. Tasks in done were completed by a
+	previous run and are skipped. on_step is called with 'clone' and with
+	the name of every task once it succeeded.
+
+	Returns the output lines of the repo so the caller can print them in
+	one block instead of interleaving them with other workers.
+	"""
+	output = []
+
+	if graph is None:
+		graph = TaskGraph()
+		graph.add(repo, repo_path)
+		graph.close()
+
+	try:
+		# Walking the object store blocks, it runs on the local budget like other blocking calls
+		size = await engine.call('local', _objects_size, repo_path) if timings.enabled and not dry_run else 0
+
+		if not os.path.exists(repo_path):
+			options = get_clone_options(repo)
+
+			if repo.clone_strategy == 'reference' and reference_dir:
+				reference, reference_output = await update_reference(engine, repo, reference_dir, dry_run)
+				output += reference_output
+
+				options['reference'] = str(reference)
+				if repo.dissociate:
+					options['dissociate'] = True
+
+			flags = _clone_flags(options)
+			output.append(" ".join(['git clone', *flags, repo.source, str(repo_path)]))
+
+			if not dry_run:
+				Path(repo_path.parent).mkdir(parents=True, exist_ok=True)
+				with timings.phase('clone', repo.dest):
+					await engine.git('clone', '--quiet', *flags, repo.source, str(repo_path), repo=repo.dest, host=get_host(repo.source))
+
+			if getattr(repo, 'sparse', None):
+				output.append(f"git sparse-checkout set {' '.join(repo.sparse)}")
+				if not dry_run:
+					await engine.git('sparse-checkout', 'set', *repo.sparse, cwd=repo_path, repo=repo.dest)
+
+			if on_step and not dry_run:
+				on_step('clone')
+
+		try:
+			output += await run_tasks(engine, graph, repo, repo_path, graph.tasks(repo), cache=task_cache, done=done, on_step=on_step, dry_run=dry_run)
+		except Exception as e:
+			output += getattr(e, 'output', [])
+			raise
+
+		if timings.enabled and not dry_run:
+			timings.count('git_bytes', await engine.call('local', _objects_size, repo_path) - size, repo.dest)
+
+	except Exception as e:
+		graph.settle(repo, "clone failed")
+		raise SyncError(e, output) from e
+
+	return output
+
+
+async def mirror_repo(engine, repo, repo_path, dry_run=False):
+	"""Keep a bare mirror of repo at repo_path.
+
+	The mirror is created with 'clone --mirror' and refreshed with
+	'remote update --prune'.
+	"""
+	output = []
+
+	try:
+		if os.path.exists(repo_path):
+			output.append("git remote update --prune")
+			if not dry_run:
+				with timings.phase('mirror-update', repo.dest):
+					await engine.git('remote', 'update', '--prune', cwd=repo_path, repo=repo.dest, host=get_host(repo.source))
+
+		else:
+			output.append(f"git clone --mirror {repo.source} {repo_path}")
+			if not dry_run:
+				Path(repo_path.parent).mkdir(parents=True, exist_ok=True)
+				with timings.phase('mirror-clone', repo.dest):
+					await engine.git('clone', '--quiet', '--mirror', repo.source, str(repo_path), repo=repo.dest, host=get_host(repo.source))
+
+	except Exception as e:
+		raise SyncError(e, output) from e
+
+	return output
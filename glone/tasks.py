@@ -0,0 +1,404 @@
+#/usr/bin/python3
+
+
+import os, sys
+import json
+import shlex
+import hashlib
+import logging
+import asyncio
+
+from pathlib import Path
+
+from glone.engine import get_budget
+from glone.inventory import RepoInventory
+from glone.limits import get_host
+from glone.scanner import STATE_DIR, load_json, store_json
+from glone.timing import timings
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+TASKS_FILE = 'tasks.json'
+TASKS_VERSION = 1
+
+
+class TaskError(Exception):
+	"""Raised for invalid task lists and tasks whose dependencies failed"""
+
+
+class Task(object):
+	"""Node of the task graph of a repo.
+
+	needs holds (repo, name) pairs, repo is None for tasks of the same repo
+	and the id or dest of the other repo otherwise.
+	"""
+	__slots__ = ('name', 'args', 'label', 'needs', 'timeout', 'cache')
+
+	def __init__(self, name, args, label, needs, timeout=None, cache=False):
+		self.name = name
+		self.args = args
+		self.label = label
+		self.needs = needs
+		self.timeout = timeout
+		self.cache = cache
+
+
+	@property
+	def is_git(self):
+		return self.args[0] == 'git'
+
+
+def _split_need(need, names):
+	if need in names or ':' not in need:
+		return None, need
+
+	repo, name = need.split(':', 1)
+	return repo, name
+
+
+def parse_tasks(tasks):
+	"""Tasks of a repo's task list (strings and dicts, see schema.repo).
+
+	Strings are git commands, their name is the command without 'git '.
+	A task without 'needs' runs after the task before it, so plain lists
+	keep running in order. Dict tasks running a command other than git
+	are cached by default. Raises TaskError for duplicate names, unknown
+	dependencies within the repo and cycles.
+	"""
+	parsed = []
+	names = {}
+
+	for task in tasks:
+		if isinstance(task, str):
+			command = task[len('git '):] if task.startswith('git ') else task
+			name = command
+			for i in range(2, len(tasks) + 2):
+				if name not in names:
+					break
+				name = f"{command}#{i}"
+			task = {'name': name, 'git': command}
+
+		elif task['name'] in names:
+			raise TaskError(f"Duplicate task name '{task['name']}'")
+
+		if 'git' in task:
+			command = f"git {task['git'][len('git '):] if task['git'].startswith('git ') else task['git']}"
+		else:
+			command = task['run']
+
+		try:
+			args = shlex.split(command)
+		except ValueError as e:
+			raise TaskError(f"Task '{task['name']}': {e}")
+
+		if not args:
+			raise TaskError(f"Task '{task['name']}' has no command")
+
+		if 'needs' in task:
+			needs = task['needs']
+		else:
+			needs = [parsed[-1].name] if parsed else []
+
+		label = command if isinstance(task.get('git'), str) and task['name'] == task['git'] else f"{task['name']}: {command}"
+		names[task['name']] = len(parsed)
+		parsed.append(Task(task['name'], args, label, needs, task.get('timeout'), task.get('cache', 'run' in task)))
+
+	for task in parsed:
+		task.needs = tuple(_split_need(need, names) for need in task.needs)
+		for repo, name in task.needs:
+			if repo is None and name not in names:
+				raise TaskError(f"Task '{task.name}' needs unknown task '{name}'")
+
+	# Depth first search for cycles within the repo, cycles across repos are found by TaskGraph.close
+	state = {}
+	def _visit(task):
+		state[task.name] = 'visiting'
+		for repo, name in task.needs:
+			if repo is not None:
+				continue
+			if state.get(name) == 'visiting':
+				raise TaskError(f"Tasks '{task.name}' and '{name}' need each other")
+			if name not in state:
+				_visit(parsed[names[name]])
+		state[task.name] = 'done'
+
+	for task in parsed:
+		if task.name not in state:
+			_visit(task)
+
+	return parsed
+
+
+class TaskGraph(object):
+	"""Tasks of all repos of a run and their outcomes.
+
+	Every task has a future that is resolved with None once it succeeded,
+	or with the reason it failed. Tasks of other repos are referenced by
+	'<repo id or dest>:<task>', they may be waited for before the repo is
+	added. Repos arrive while the remotes are still listed, close() is
+	called once all repos were added and fails the dependencies that were
+	never added or form a cycle.
+	"""
+	def __init__(self):
+		self._futures = {}
+		self._repos = {}
+		self._tasks = {}
+		self._paths = {}
+		self._inventory = RepoInventory()
+		self._closed = False
+
+
+	def _resolve(self, ref):
+		"""Dest of the repo named by ref (its dest or id), ref itself if no such repo was added yet"""
+		repo = self._inventory.get_by_dest(ref)
+
+		if repo is None:
+			repos = self._inventory.find_by_id(ref)
+			repo = repos[0] if repos else None
+
+		return str(repo.dest) if repo is not None else ref
+
+
+	def _future(self, key):
+		future = self._futures.get(key)
+
+		if future is None:
+			future = self._futures[key] = asyncio.get_running_loop().create_future()
+			if self._closed and key not in self._tasks:
+				future.set_result(f"unknown task {key[0]}:{key[1]}")
+
+		return future
+
+
+	def _chain(self, source, target):
+		def _copy(done):
+			if not target.done():
+				target.set_result(done.result())
+
+		source.add_done_callback(_copy)
+
+
+	def add(self, repo, path):
+		"""Add the tasks of repo cloned to path, returns them. Raises TaskError for invalid task lists"""
+		tasks = parse_tasks(repo.tasks or ())
+		dest = str(repo.dest)
+
+		self._repos[dest] = tasks
+		self._paths[dest] = Path(path)
+		self._inventory.add(repo)
+
+		for task in tasks:
+			key = (dest, task.name)
+			self._tasks[key] = [(r or dest, name) for r, name in task.needs]
+
+			# Tasks waiting since before the repo was added may name it by id
+			alias = (str(repo.id), task.name)
+			if alias != key and alias in self._futures and alias not in self._tasks:
+				self._tasks[alias] = [key]
+				self._chain(self._future(key), self._futures[alias])
+
+		return tasks
+
+
+	def settle(self, repo, error=None):
+		"""Resolve the tasks of repo that are still pending, with error or as done"""
+		dest = str(repo.dest)
+
+		for task in self._repos.get(dest, ()):
+			future = self._future((dest, task.name))
+			if not future.done():
+				future.set_result(error)
+
+
+	def complete(self, repo, task, error=None):
+		future = self._future((str(repo.dest), task.name))
+		if not future.done():
+			future.set_result(error)
+
+
+	def tasks(self, repo):
+		return self._repos.get(str(repo.dest), [])
+
+
+	def path(self, ref):
+		return self._paths.get(self._resolve(ref))
+
+
+	async def wait(self, repo, task):
+		"""Wait for the dependencies of task, raises TaskError if one of them failed"""
+		for ref, name in task.needs:
+			ref = ref or str(repo.dest)
+			error = await self._future((self._resolve(ref), name))
+
+			if error is not None:
+				raise TaskError(f"needs {ref}:{name}, {error}" if ref != str(repo.dest) else f"needs {name}, {error}")
+
+
+	def close(self):
+		"""All repos were added, fail dependencies on unknown tasks and on cycles"""
+		self._closed = True
+
+		for key, future in self._futures.items():
+			if key not in self._tasks and not future.done():
+				future.set_result(f"unknown task {key[0]}:{key[1]}")
+
+		# All repos are known now, dependencies are followed by dest
+		edges = {key: [(self._resolve(ref), name) for ref, name in needs] for key, needs in self._tasks.items()}
+
+		state = {}
+		for start in edges:
+			if start in state:
+				continue
+
+			# Iterative depth first search, the path is kept to name the cycle
+			path = [start]
+			stack = [iter(edges[start])]
+			state[start] = 'visiting'
+
+			while stack:
+				key = next(stack[-1], None)
+
+				if key is None:
+					state[path.pop()] = 'done'
+					stack.pop()
+
+				elif state.get(key) == 'visiting':
+					cycle = path[path.index(key):]
+					for member in cycle:
+						future = self._future(member)
+						if not future.done():
+							future.set_result(f"dependency cycle {' -> '.join(':'.join(k) for k in cycle + [key])}")
+
+				elif key not in state and key in edges:
+					state[key] = 'visiting'
+					path.append(key)
+					stack.append(iter(edges[key]))
+
+
+class TaskCache(object):
+	"""Fingerprints of the tasks that succeeded, keyed by dest and task name.
+
+	The fingerprint covers the command, the HEAD of the repo and the HEADs
+	of the other repos the task needs, a cached task is skipped as long as
+	none of them changed. Stored in <prefix>/.glone/tasks.json.
+	"""
+	def __init__(self, prefix, force=False):
+		self.path = Path(prefix) / STATE_DIR / TASKS_FILE
+		self.entries = {} if force else self._load()
+
+
+	def _load(self):
+		data = load_json(self.path, TASKS_VERSION)
+		return data['repos'] if data else {}
+
+
+	def store(self):
+		store_json(self.path, {'repos': self.entries}, TASKS_VERSION)
+
+
+	def get(self, dest, name):
+		return self.entries.get(str(dest), {}).get(name)
+
+
+	def set(self, dest, name, fingerprint):
+		if fingerprint is None:
+			self.entries.get(str(dest), {}).pop(name, None)
+		else:
+			self.entries.setdefault(str(dest), {})[name] = fingerprint
+
+
+async def _head(engine, path):
+	try:
+		return await engine.git('rev-parse', 'HEAD', cwd=path, budget='local')
+	except Exception:
+		return None
+
+
+async def _fingerprint(engine, graph, repo, repo_path, task):
+	"""Fingerprint of task, None if a HEAD can not be resolved"""
+	heads = [await _head(engine, repo_path)]
+
+	for ref in sorted({ref for ref, name in task.needs if ref is not None}):
+		path = graph.path(ref)
+		heads.append(await _head(engine, path) if path else None)
+
+	if None in heads:
+		return None
+
+	return hashlib.sha1(json.dumps([task.args, heads]).encode()).hexdigest()
+
+
+async def run_tasks(engine, graph, repo, repo_path, tasks, cache=None, done=(), on_step=None, dry_run=False):
+	"""Run the tasks of repo as soon as their dependencies are done.
+
+	Tasks without dependencies between them run concurrently, git commands
+	on the network or local budget and other commands on the local budget.
+	Tasks in done are skipped. Returns the output lines in task order,
+	raises TaskError (carrying the output in its output attribute) if a
+	task failed or one of its dependencies did.
+	"""
+	outputs = {task.name: [task.label] for task in tasks}
+	errors = []
+
+	async def _run(task):
+		lines = outputs[task.name]
+
+		try:
+			await graph.wait(repo, task)
+
+			if task.name in done:
+				lines[0] += " (done by previous run)"
+				graph.complete(repo, task)
+				return
+
+			if dry_run:
+				graph.complete(repo, task)
+				return
+
+			if task.cache and cache is not None:
+				fingerprint = await _fingerprint(engine, graph, repo, repo_path, task)
+				if fingerprint is not None and cache.get(repo.dest, task.name) == fingerprint:
+					lines[0] += " (cached, unchanged since last run)"
+					graph.complete(repo, task)
+					if on_step:
+						on_step(task.name)
+					return
+
+			with timings.phase('task', repo.dest):
+				if task.is_git:
+					args = task.args[1:]
+					result = await engine.git(*args, cwd=repo_path, budget=get_budget(args), repo=repo.dest,
+						host=get_host(repo.source), timeout=task.timeout)
+				else:
+					result = await engine.command(*task.args, cwd=repo_path, timeout=task.timeout, repo=repo.dest)
+
+			if result:
+				lines += [f"  {line}" for line in result.split('\n')]
+
+			if task.cache and cache is not None:
+				cache.set(repo.dest, task.name, await _fingerprint(engine, graph, repo, repo_path, task))
+
+			graph.complete(repo, task)
+			if on_step:
+				on_step(task.name)
+
+		except Exception as e:
+			lines.append(f"  failed: {e}")
+			errors.append(e)
+			graph.complete(repo, task, str(e) if isinstance(e, TaskError) else "failed")
+
+			if task.cache and cache is not None:
+				cache.set(repo.dest, task.name, None)
+
+	await asyncio.gather(*[_run(task) for task in tasks])
+
+	output = [line for task in tasks for line in outputs[task.name]]
+
+	if errors:
+		error = TaskError(f"{len(errors)} of {len(tasks)} tasks failed: {errors[0]}")
+		error.output = output
+		raise error
+
+	return output
@@ -0,0 +1,117 @@
+#/usr/bin/python3
+
+
+import os, sys
+import json
+import time
+import logging
+import threading
+
+from contextlib import contextmanager
+
+
+
+logging.basicConfig(format='%(levelname)-10s ->\t%(message)s', level=logging.INFO)
+
+
+class Timings(object):
+	"""Per-phase and per-repo instrumentation of a run.
+
+	Phases are timed with the phase() context manager, counters (spawned
+	processes, transferred bytes) are added with count(). Both can be
+	attributed to a repo. While disabled nothing is recorded, so the calls
+	can stay in hot paths.
+	"""
+	def __init__(self):
+		self.enabled = False
+		self.events = []
+		self.counters = {}
+		self.repo_counters = {}
+		self._lock = threading.Lock()
+		self._start = time.perf_counter()
+
+
+	def enable(self):
+		self.enabled = True
+		self._start = time.perf_counter()
+
+
+	@contextmanager
+	def phase(self, name, repo=None):
+		if not self.enabled:
+			yield
+			return
+
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			end = time.perf_counter()
+			with self._lock:
+				self.events.append({
+					'name': name,
+					'repo': repo,
+					'start': start - self._start,
+					'duration': end - start,
+					'thread': threading.get_ident(),
+				})
+
+
+	def count(self, key, value=1, repo=None):
+		if not self.enabled:
+			return
+
+		with self._lock:
+			self.counters[key] = self.counters.get(key, 0) + value
+			if repo is not None:
+				counters = self.repo_counters.setdefault(repo, {})
+				counters[key] = counters.get(key, 0) + value
+
+
+	def summary(self, top=10):
+		"""Log the totals per phase and the top slowest repos"""
+		phases = {}
+		repos = {}
+		for event in self.events:
+			total, calls = phases.get(event['name'], (0.0, 0))
+			phases[event['name']] = (total + event['duration'], calls + 1)
+			if event['repo'] is not None:
+				repos[event['repo']] = repos.get(event['repo'], 0.0) + event['duration']
+
+		logging.info(f"Timings (wall time {time.perf_counter() - self._start:.3f}s)")
+		for name, (total, calls) in sorted(phases.items(), key=lambda p: -p[1][0]):
+			logging.info(f"\t{name:<16} {total:10.3f}s  {calls:>6} calls")
+
+		for key, value in sorted(self.counters.items()):
+			logging.info(f"\t{key:<16} {value:>10}")
+
+		if repos:
+			logging.info(f"Slowest {min(top, len(repos))} repos")
+			for repo, total in sorted(repos.items(), key=lambda r: -r[1])[:top]:
+				counters = ", ".join(f"{k}: {v}" for k, v in sorted(self.repo_counters.get(repo, {}).items()))
+				logging.info(f"\t{total:10.3f}s  {repo}  {counters}")
+
+
+	def write_trace(self, path):
+		"""Write the recorded phases as a Chrome trace (chrome://tracing, Perfetto)"""
+		pid = os.getpid()
+		trace = [
+			{
+				'name': event['name'] if event['repo'] is None else f"{event['name']} {event['repo']}",
+				'cat': event['name'],
+				'ph': 'X',
+				'ts': event['start'] * 1e6,
+				'dur': event['duration'] * 1e6,
+				'pid': pid,
+				'tid': event['thread'],
+				'args': {'repo': str(event['repo'])} if event['repo'] is not None else {},
+			}
+			for event in self.events
+		]
+
+		with open(path, 'w') as file:
+			json.dump({'traceEvents': trace, 'otherData': {'counters': self.counters}}, file)
+
+
+# Instrumentation of the current run
+timings = Timings()
@@ -0,0 +1,93 @@
+#/usr/bin/python3
+
+
+import os, sys
+import random
+import tempfile
+import unittest
+import subprocess
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from glone.backend import NativeBackend, SubprocessBackend
+
+
+
+def git(path, *args, input=None):
+	return subprocess.run(['git', '-C', str(path), *args], check=True, capture_output=True, text=True, input=input).stdout.strip()
+
+
+def make_history(path, rng, commits=40, branches=10, skew=0.15):
+	"""Random DAG of commits with merges, a share of them dated before their parents.
+
+	Every branch b<i> gets one of the others as upstream (remote '.').
+	"""
+	stream = []
+	for i in range(commits):
+		date = 1000000 + i * 1000
+		if i and rng.random() < skew:
+			date = rng.randrange(1000, 1000000)
+
+		stream += [
+			"commit refs/heads/main",
+			f"mark :{i + 1}",
+			f"committer glone <glone@localhost> {date} +0000",
+			f"data {len(str(i))}",
+			str(i),
+		]
+
+		parents = rng.sample(range(i), min(i, 2 if rng.random() < 0.25 else 1)) if i else []
+		stream += [f"from :{parents[0] + 1}"] if parents else []
+		stream += [f"merge :{parent + 1}" for parent in parents[1:]]
+
+	tips = rng.sample(range(commits), branches)
+	for b, tip in enumerate(tips):
+		stream += [f"reset refs/heads/b{b}", f"from :{tip + 1}", ""]
+
+	git(path, 'fast-import', '--quiet', input="\n".join(stream) + "\n")
+
+	with open(Path(path) / '.git' / 'config', 'a') as file:
+		for b in range(branches):
+			file.write(f'[branch "b{b}"]\n\tremote = .\n\tmerge = refs/heads/b{rng.choice([u for u in range(branches) if u != b])}\n')
+
+
+class DivergenceTest(unittest.TestCase):
+	"""The native backend counts ahead/behind like 'git rev-list --left-right --count'"""
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+
+
+	def tearDown(self):
+		self._tmp.cleanup()
+
+
+	def check_histories(self, seed, skew):
+		rng = random.Random(seed)
+
+		for n in range(40):
+			path = Path(self._tmp.name) / f"{seed}-{n}"
+			git(self._tmp.name, 'init', '--quiet', str(path))
+			make_history(path, rng, skew=skew)
+
+			native = NativeBackend().branches(path)
+			self.assertEqual(native, SubprocessBackend().branches(path))
+
+			for head, name, upstream, divergence in native:
+				if not upstream:
+					continue
+				behind, ahead = git(path, 'rev-list', '--left-right', '--count', f"{upstream}...{name}").split()
+				self.assertEqual(divergence, (int(behind), int(ahead)), f"{name}...{upstream} in history {seed}-{n}")
+
+
+	def test_monotonic_dates(self):
+		self.check_histories(1, skew=0)
+
+
+	def test_skewed_dates(self):
+		self.check_histories(2, skew=0.15)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,104 @@
+#/usr/bin/python3
+
+
+import os, sys
+import logging
+import itertools
+import tempfile
+import unittest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bench'))
+
+from mock_github import MockGithub, make_repository
+
+from glone import GithubRemote
+from glone.cache import RemoteCache
+from glone.config import load_config
+from glone.github import OWNERS_PER_QUERY, PER_PAGE
+
+
+
+_ids = itertools.count(1)
+
+
+def make_owner(login, names):
+	return [make_repository(next(_ids), login, name, f"git@localhost:{login}/{name}.git") for name in names]
+
+
+class GithubRemoteTest(unittest.TestCase):
+	"""Repos of many owners are listed in batched, paged GraphQL queries"""
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+
+		self.owners = {f"org{i}": make_owner(f"org{i}", [f"r{r}" for r in range(3)]) for i in range(OWNERS_PER_QUERY + 1)}
+		self.owners['big'] = make_owner('big', [f"r{r}" for r in range(2 * PER_PAGE + 50)])
+		self.owners['acme'] = make_owner('acme', ['toolbox', 'lib', 'Tooling'])
+		self.owners['tools'] = make_owner('tools', ['a', 'b'])
+
+		self.mock = MockGithub(self.owners).start()
+
+		groups = [f"{{id: {login}, source: {login}}}" for login in sorted(self.owners) if login not in ('acme', 'tools')]
+		groups += ["{id: acme, source: acme, search: TOOL}", "{id: tools, source: tools, search: tools}", "{id: ghost, source: ghost}"]
+
+		self.config_path = Path(self._tmp.name) / 'glone.yml'
+		self.config_path.write_text(f"""auth: [{{id: a, token: t}}]
+remotes:
+  - id: gh
+    type: github
+    auth: a
+    url: {self.mock.url}
+    users: []
+    groups: [{', '.join(groups)}]
+""")
+
+
+	def tearDown(self):
+		self.mock.stop()
+		self._tmp.cleanup()
+
+
+	def list_repos(self, offline=False):
+		config = load_config(self.config_path, use_cache=False)
+		cache = RemoteCache(Path(self._tmp.name) / 'cache', 3600, offline=offline)
+		remote = GithubRemote(config['auth'][0], config['remotes'][0], {'defaults': config.get('defaults', {})}, cache)
+
+		repos = {}
+		for repo in remote.get_repos():
+			repos.setdefault(str(Path(repo.dest).parent), set()).add(repo.name)
+
+		return repos
+
+
+	def test_get_repos(self):
+		with self.assertLogs(level=logging.WARNING) as logs:
+			repos = self.list_repos()
+
+		self.assertEqual(set(repos), {login for login in self.owners})
+		for login, names in repos.items():
+			if login not in ('acme', 'tools'):
+				self.assertEqual(names, {repo['name'] for repo in self.owners[login]}, login)
+
+		# search matches the name or the path, ignoring case
+		self.assertEqual(repos['acme'], {'toolbox', 'Tooling'})
+		self.assertEqual(repos['tools'], {'a', 'b'})
+
+		self.assertIn("Could not resolve to a User with the login of 'ghost'", "\n".join(logs.output))
+
+		# 15 owners in two queries, plus two more pages of 'big'
+		self.assertEqual(self.mock.requests, 4)
+
+
+	def test_offline(self):
+		with self.assertLogs(level=logging.WARNING):
+			repos = self.list_repos()
+		requests = self.mock.requests
+
+		self.assertEqual(self.list_repos(offline=True), repos)
+		self.assertEqual(self.mock.requests, requests)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,44 @@
+#/usr/bin/python3
+
+
+import os, sys
+import unittest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from glone.group import make_matcher
+
+
+
+class MatcherTest(unittest.TestCase):
+	def test_plain_patterns(self):
+		matches = make_matcher(includes=['lib-.*', 'app'], excludes=['lib-old'])
+
+		self.assertTrue(matches('lib-core'))
+		self.assertTrue(matches('app-web'))
+		self.assertFalse(matches('lib-old'))
+		self.assertFalse(matches('tool'))
+
+
+	def test_inline_flags_after_first_pattern(self):
+		matches = make_matcher(includes=['app', '(?i)lib-.*'])
+
+		self.assertTrue(matches('LIB-core'))
+		self.assertTrue(matches('app'))
+		# The flag of the second pattern does not apply to the first
+		self.assertFalse(matches('APP'))
+
+
+	def test_backreferences(self):
+		# Joined into one regex, \1 of the second pattern would refer to the group of the first
+		matches = make_matcher(excludes=[r'(a)b', r'(\w)\1'])
+
+		self.assertFalse(matches('ab'))
+		self.assertFalse(matches('cc'))
+		self.assertTrue(matches('cd'))
+
+
+if __name__ == '__main__':
+	unittest.main()
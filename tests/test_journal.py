@@ -0,0 +1,80 @@
+#/usr/bin/python3
+
+
+import os, sys
+import json
+import tempfile
+import unittest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from glone.journal import RunJournal
+
+
+
+class SelectTest(unittest.TestCase):
+	"""A continued run picks the repos and steps left by the last one"""
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		self.prefix = self._tmp.name
+
+		# 'done' finished, 'failed' failed after its clone, 'killed' was interrupted after its clone
+		journal = RunJournal(self.prefix)
+		journal.open()
+		journal.step('done', 'clone')
+		journal.step('done', 'build')
+		journal.finish('done', 'done')
+		journal.step('failed', 'clone')
+		journal.finish('failed', 'failed')
+		journal.step('killed', 'clone')
+		journal._file.close()
+
+		# A run killed while writing leaves a partial last line
+		with open(journal.path, 'a') as file:
+			file.write('{"event": "step", "repo": "kil')
+
+
+	def tearDown(self):
+		self._tmp.cleanup()
+
+
+	def select(self, mode):
+		journal = RunJournal(self.prefix)
+		journal.open(mode, dry_run=True)
+		return {key: journal.select(key) for key in ['done', 'failed', 'killed', 'new']}
+
+
+	def test_new_run(self):
+		self.assertEqual(self.select(None), {'done': set(), 'failed': set(), 'killed': set(), 'new': set()})
+
+
+	def test_resume(self):
+		self.assertEqual(self.select('resume'), {'done': None, 'failed': None, 'killed': {'clone'}, 'new': set()})
+
+
+	def test_retry_failed(self):
+		self.assertEqual(self.select('retry-failed'), {'done': None, 'failed': {'clone'}, 'killed': None, 'new': None})
+
+
+	def test_resumed_run_appends(self):
+		journal = RunJournal(self.prefix)
+		journal.open('resume')
+		journal.step('killed', 'build')
+		journal.finish('killed', 'done')
+		journal.close()
+
+		self.assertEqual(self.select('resume'), {'done': None, 'failed': None, 'killed': None, 'new': set()})
+
+
+	def test_other_version(self):
+		with open(Path(self.prefix) / '.glone' / 'journal.jsonl', 'w') as file:
+			file.write(json.dumps({'event': 'start', 'version': 0}) + '\n')
+			file.write(json.dumps({'event': 'repo', 'repo': 'done', 'status': 'done'}) + '\n')
+
+		self.assertEqual(self.select('resume'), {'done': set(), 'failed': set(), 'killed': set(), 'new': set()})
+
+
+if __name__ == '__main__':
+	unittest.main()
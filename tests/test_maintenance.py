@@ -0,0 +1,72 @@
+#/usr/bin/python3
+
+
+import os, sys
+import tempfile
+import unittest
+import subprocess
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from glone.engine import Engine
+from glone.scanner import LocalScanner, get_repo_path, is_bare
+from glone.maintenance import get_pack_stats, get_maintenance_steps, maintain_repo
+
+
+
+def git(path, *args):
+	env = dict(os.environ, GIT_AUTHOR_NAME='glone', GIT_AUTHOR_EMAIL='glone@localhost', GIT_COMMITTER_NAME='glone', GIT_COMMITTER_EMAIL='glone@localhost')
+	return subprocess.run(['git', '-C', str(path), *args], check=True, capture_output=True, text=True, env=env).stdout.strip()
+
+
+class MirroredPrefixTest(unittest.TestCase):
+	"""Bare mirrors as created by 'update --mirror' are found and maintained"""
+	def setUp(self):
+		self._tmp = tempfile.TemporaryDirectory()
+		root = Path(self._tmp.name)
+
+		self.source = root / 'source'
+		git(root, 'init', '--quiet', str(self.source))
+		for i in range(3):
+			git(self.source, 'commit', '--quiet', '--allow-empty', '-m', f"commit {i}")
+
+		self.prefix = root / 'prefix'
+		self.mirror = self.prefix / 'grp' / 'a.git'
+		self.clone = self.prefix / 'b'
+		git(root, 'clone', '--quiet', '--mirror', str(self.source), str(self.mirror))
+		git(root, 'clone', '--quiet', str(self.source), str(self.clone))
+
+
+	def tearDown(self):
+		self._tmp.cleanup()
+
+
+	def test_scan_finds_mirrors(self):
+		git_dirs = LocalScanner(self.prefix).scan()
+
+		self.assertEqual([get_repo_path(git_dir) for git_dir in git_dirs], [self.clone, self.mirror])
+		self.assertEqual([is_bare(git_dir) for git_dir in git_dirs], [False, True])
+
+
+	def test_maintain_mirror(self):
+		engine = Engine(api=1, network=1, local=2)
+		try:
+			stats = engine.run(get_pack_stats(engine, self.mirror))
+			self.assertTrue(stats['bare'])
+			self.assertGreater(stats['count'], 0)
+			self.assertNotIn(['config', 'core.untrackedCache', 'true'], get_maintenance_steps(stats))
+
+			engine.run(maintain_repo(engine, self.mirror, stats))
+			stats = engine.run(get_pack_stats(engine, self.mirror))
+		finally:
+			engine.close()
+
+		self.assertEqual(stats['count'], 0)
+		self.assertTrue(stats['commit-graph'])
+		self.assertTrue(stats['multi-pack-index'])
+
+
+if __name__ == '__main__':
+	unittest.main()
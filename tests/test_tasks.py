@@ -0,0 +1,187 @@
+#/usr/bin/python3
+
+
+import os, sys
+import asyncio
+import unittest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from glone.engine import Engine
+from glone.repo import GloneRepo
+from glone.tasks import TaskError, TaskGraph, parse_tasks
+
+
+
+def make_repo(repo_id, tasks, dest=None):
+	return GloneRepo({'id': repo_id, 'source': f"/src/{repo_id}.git", 'dest': dest, 'tasks': tasks})
+
+
+class ParseTasksTest(unittest.TestCase):
+	"""Task lists are checked within the repo"""
+	def test_plain_list_runs_in_order(self):
+		tasks = parse_tasks(['git fetch', 'git gc', 'git fetch'])
+
+		self.assertEqual([task.name for task in tasks], ['fetch', 'gc', 'fetch#2'])
+		self.assertEqual([task.needs for task in tasks], [(), ((None, 'fetch'),), ((None, 'gc'),)])
+		self.assertEqual(tasks[2].args, ['git', 'fetch'])
+
+
+	def test_needs(self):
+		tasks = parse_tasks([
+			{'name': 'build', 'run': 'make', 'needs': ['lib:build']},
+			{'name': 'test', 'run': 'make test', 'needs': ['build', 'grp/tools:setup']},
+		])
+
+		self.assertEqual(tasks[0].needs, (('lib', 'build'),))
+		self.assertEqual(tasks[1].needs, ((None, 'build'), ('grp/tools', 'setup')))
+		self.assertTrue(tasks[0].cache)
+
+
+	def test_duplicate_names(self):
+		with self.assertRaisesRegex(TaskError, "Duplicate task name 'build'"):
+			parse_tasks([{'name': 'build', 'run': 'make'}, {'name': 'build', 'run': 'make all'}])
+
+
+	def test_unknown_needs(self):
+		with self.assertRaisesRegex(TaskError, "needs unknown task 'setup'"):
+			parse_tasks([{'name': 'build', 'run': 'make', 'needs': ['setup']}])
+
+
+	def test_cycle(self):
+		with self.assertRaisesRegex(TaskError, "need each other"):
+			parse_tasks([
+				{'name': 'a', 'run': 'true', 'needs': ['b']},
+				{'name': 'b', 'run': 'true', 'needs': ['a']},
+			])
+
+
+class TaskGraphTest(unittest.TestCase):
+	"""Dependencies across repos are resolved once the repos are added"""
+	def wait(self, graph, repo, timeout=5):
+		async def _wait():
+			try:
+				await graph.wait(repo, graph.tasks(repo)[0])
+			except TaskError as e:
+				return str(e)
+
+		return asyncio.wait_for(_wait(), timeout)
+
+
+	def test_unknown_repo(self):
+		async def _run():
+			graph = TaskGraph()
+			a = make_repo('a', [{'name': 't', 'run': 'true', 'needs': ['nope:t']}])
+			graph.add(a, '/prefix/a')
+
+			waiting = asyncio.create_task(self.wait(graph, a))
+			graph.close()
+			return await waiting
+
+		self.assertEqual(asyncio.run(_run()), "needs nope:t, unknown task nope:t")
+
+
+	def test_cycle_across_repos(self):
+		async def _run():
+			graph = TaskGraph()
+			a = make_repo('a', [{'name': 't', 'run': 'true', 'needs': ['b:t']}])
+			b = make_repo('b', [{'name': 't', 'run': 'true', 'needs': ['a:t']}])
+			graph.add(a, '/prefix/a')
+			graph.add(b, '/prefix/b')
+			graph.close()
+
+			return await self.wait(graph, a), await self.wait(graph, b)
+
+		self.assertEqual(asyncio.run(_run()), (
+			"needs b:t, dependency cycle a:t -> b:t -> a:t",
+			"needs a:t, dependency cycle a:t -> b:t -> a:t",
+		))
+
+
+	def test_cycle_through_id_and_dest(self):
+		async def _run():
+			graph = TaskGraph()
+			a = make_repo('a', [{'name': 't', 'run': 'true', 'needs': ['b:t']}])
+			b = make_repo('b', [{'name': 't', 'run': 'true', 'needs': ['a:t']}], dest='grp/b')
+			graph.add(a, '/prefix/a')
+			graph.add(b, '/prefix/grp/b')
+			graph.close()
+
+			return await self.wait(graph, a)
+
+		self.assertEqual(asyncio.run(_run()), "needs b:t, dependency cycle a:t -> grp/b:t -> a:t")
+
+
+	def test_id_and_dest_alias(self):
+		async def _run():
+			graph = TaskGraph()
+			a = make_repo('a', [{'name': 't', 'run': 'true', 'needs': ['b:build']}])
+			c = make_repo('c', [{'name': 't', 'run': 'true', 'needs': ['grp/b:build']}])
+			b = make_repo('b', [{'name': 'build', 'run': 'make', 'needs': []}], dest='grp/b')
+
+			# a waits for b by id before b is known, c by dest once it is
+			graph.add(a, '/prefix/a')
+			by_id = asyncio.create_task(self.wait(graph, a))
+			await asyncio.sleep(0)
+
+			graph.add(b, '/prefix/grp/b')
+			graph.add(c, '/prefix/c')
+			by_dest = asyncio.create_task(self.wait(graph, c))
+			graph.close()
+
+			self.assertEqual(graph.path('b'), Path('/prefix/grp/b'))
+			self.assertEqual(graph.path('grp/b'), Path('/prefix/grp/b'))
+
+			graph.complete(b, graph.tasks(b)[0])
+			return await by_id, await by_dest
+
+		self.assertEqual(asyncio.run(_run()), (None, None))
+
+
+	def test_failed_dependency(self):
+		async def _run():
+			graph = TaskGraph()
+			a = make_repo('a', [{'name': 't', 'run': 'true', 'needs': ['b:build']}])
+			b = make_repo('b', [{'name': 'build', 'run': 'make', 'needs': []}])
+			graph.add(a, '/prefix/a')
+			graph.add(b, '/prefix/b')
+			graph.close()
+
+			graph.settle(b, "clone failed")
+			return await self.wait(graph, a)
+
+		self.assertEqual(asyncio.run(_run()), "needs b:build, clone failed")
+
+
+	def test_close_when_discovery_fails(self):
+		engine = Engine(api=1, network=1, local=1)
+		graph = TaskGraph()
+		a = make_repo('a', [{'name': 't', 'run': 'true', 'needs': ['b:t']}])
+
+		def _repos():
+			yield a
+			raise RuntimeError("discovery failed")
+
+		errors = []
+
+		async def _add(repo):
+			graph.add(repo, '/prefix/a')
+			errors.append(await self.wait(graph, repo))
+
+		async def _run():
+			async for item, result, error in engine.map(_add, _repos(), on_exhausted=graph.close):
+				pass
+
+		try:
+			with self.assertRaisesRegex(RuntimeError, "discovery failed"):
+				engine.run(_run())
+		finally:
+			engine.close()
+
+		self.assertEqual(errors, ["needs b:t, unknown task b:t"])
+
+
+if __name__ == '__main__':
+	unittest.main()